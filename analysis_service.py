@@ -0,0 +1,267 @@
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import wave
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+import numpy as np
+import tuner_core
+
+
+# ***************************
+# *    Global variables     *
+# ***************************
+# -------------------------------------------------------------------
+# DSP pool
+# Worker processes per server process. With gunicorn every worker starts its own pool, so keep
+# workers x analysis_workers around the number of CPU cores; set ANALYSIS_WORKERS to change it.
+analysis_workers = int(os.environ.get('ANALYSIS_WORKERS', 2))
+analysis_batch_wait = 0.01              # sec - How long a batch waits for clips of other requests before it starts
+analysis_batch_frames = 4096            # Frames per batch at most (a longer clip gets a batch of its own)
+
+# Raw PCM uploads: format name -> NumPy data type of the little-endian samples
+raw_sample_formats = {'s16le': '<i2', 's32le': '<i4', 'f32le': '<f4'}
+
+
+# ***************************
+# *    Analysis service     *
+# ***************************
+# Pitch analysis of uploaded clips for the server ('/api/analyze').
+# -------------------------------------------------------------------
+# The estimators are vectorized over frames (see tuner_core.PitchAnalyzer), so analysing the frames of many
+# clips in one call is much cheaper than analysing every clip on its own. Clips submitted by concurrent
+# requests are therefore put into a queue; a dispatcher thread collects them for up to
+# 'analysis_batch_wait' seconds (or 'analysis_batch_frames' frames), groups them by window size, samplerate
+# and estimator, and sends every group to a process pool as one job. The DSP runs outside the server process,
+# so it neither holds the GIL of the request threads nor blocks them; a request only waits for its future.
+#
+# The pool and the dispatcher start with the first clip, i.e. after a WSGI server has forked its workers.
+class AnalysisService:
+    def __init__(self, workers=analysis_workers, batch_wait=analysis_batch_wait, batch_frames=analysis_batch_frames):
+        self.workers = workers
+        self.batch_wait = batch_wait
+        self.batch_frames = batch_frames
+        # Queued clips: (key, signal, hop size, number of frames, future), or None to stop the dispatcher.
+        self.jobs = queue.Queue()
+        self.pool = None
+        self.dispatcher = None
+        self.lock = threading.Lock()
+
+    # Starts the process pool and the dispatcher thread, if they are not running yet.
+    def start(self):
+        with self.lock:
+            if self.pool is None:
+                self.pool = new_pool(self.workers)
+                self.dispatcher = threading.Thread(target=self._dispatch, args=(self.pool,), daemon=True)
+                self.dispatcher.start()
+
+    # Stops the dispatcher and the process pool. Clips still waiting in a batch are finished first.
+    def shutdown(self):
+        with self.lock:
+            pool, dispatcher = self.pool, self.dispatcher
+            self.pool = self.dispatcher = None
+        if pool is not None:
+            self.jobs.put(None)
+            dispatcher.join()
+            pool.shutdown()
+
+    # Queues a mono clip for analysis with windows of 'frame_size' samples every 'hop_size' samples.
+    # Returns a Future of the array with the frequency of every frame (0 Hz where no pitch was found).
+    def submit(self, signal, samplerate, frame_size=4096, hop_size=2048, method=None):
+        self.start()
+        future = Future()
+        frames = max(len(signal) - frame_size, 0) // hop_size + 1
+        self.jobs.put(((frame_size, samplerate, method or tuner_core.pitch_estimator), signal, hop_size, frames,
+                       future))
+        return future
+
+    # Dispatcher thread: collects queued clips into batches and sends them to the pool.
+    def _dispatch(self, pool):
+        stopping = False
+        while not stopping:
+            job = self.jobs.get()
+            if job is None:
+                return
+            batch = [job]
+            frames = job[3]
+            deadline = time.monotonic() + self.batch_wait
+            while frames < self.batch_frames:
+                try:
+                    job = self.jobs.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+                frames += job[3]
+
+            groups = {}
+            for job in batch:
+                groups.setdefault(job[0], []).append(job)
+            for (frame_size, samplerate, method), jobs in groups.items():
+                task = (estimate_clips, [job[1] for job in jobs], [job[2] for job in jobs], frame_size, samplerate,
+                        method)
+                try:
+                    try:
+                        result = pool.submit(*task)
+                    except BrokenProcessPool:
+                        # A worker process died (the clips it had fail with this error), which breaks the pool
+                        # for good: go on with a new one.
+                        pool = self._replace_pool(pool)
+                        result = pool.submit(*task)
+                except RuntimeError as error:
+                    # The pool is shut down.
+                    for job in jobs:
+                        job[4].set_exception(error)
+                    continue
+                result.add_done_callback(partial(self._finish, jobs))
+
+    # Replaces the broken 'pool' with a new process pool and returns it. Returns 'pool' itself, which refuses
+    # all work, if the service has been shut down meanwhile.
+    def _replace_pool(self, pool):
+        with self.lock:
+            if self.pool is pool:
+                self.pool = new_pool(self.workers)
+            replacement = self.pool or pool
+        if replacement is not pool:
+            pool.shutdown(wait=False)
+        return replacement
+
+    # Hands the results of a pool job to the futures of its clips.
+    @staticmethod
+    def _finish(jobs, result):
+        try:
+            frequencies = result.result()
+        except Exception as error:
+            for job in jobs:
+                job[4].set_exception(error)
+            return
+        for job, clip_frequencies in zip(jobs, frequencies):
+            job[4].set_result(clip_frequencies)
+
+
+# ***************************
+# *        Functions        *
+# ***************************
+# Starts a process pool for the analysis. The server process runs threads, which a forked worker would inherit
+# in whatever state they are (e.g. holding a lock), so the workers are started by a fork server, or spawned
+# where there is none (Windows).
+def new_pool(workers):
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method))
+
+
+# Runs in the worker processes of the pool.
+# -------------------------------------------------------------------
+# Estimates the pitch of every frame of several clips with vectorized calls of up to analyzer.batch_rows()
+# frames, which may span several clips. Returns one array of frequencies per clip.
+def estimate_clips(signals, hop_sizes, frame_size, samplerate, method):
+    clips = [tuner_core.frame_signal(signal, frame_size, hop_size) for signal, hop_size in zip(signals, hop_sizes)]
+    # A new analyzer rather than get_analyzer(): a worker would otherwise keep the work buffers of every window
+    # size and samplerate it has seen (up to tuner_core.max_batch_bytes each) for good.
+    analyzer = tuner_core.PitchAnalyzer(frame_size, samplerate)
+    frequencies = np.empty(sum(len(frames) for frames in clips))
+    done = 0
+    for chunk in iterate_chunks(clips, analyzer.batch_rows(method)):
+        frequencies[done:done + len(chunk)] = analyzer.estimate(chunk, method)
+        done += len(chunk)
+    return np.split(frequencies, np.cumsum([len(frames) for frames in clips])[:-1])
+
+
+# Yields the rows of several 2-D arrays in chunks of 'size' rows (the last chunk may be shorter).
+def iterate_chunks(arrays, size):
+    pending = []
+    pending_rows = 0
+    for array in arrays:
+        start = 0
+        while start < len(array):
+            take = min(size - pending_rows, len(array) - start)
+            pending.append(array[start:start + take])
+            pending_rows += take
+            start += take
+            if pending_rows == size:
+                yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+                pending = []
+                pending_rows = 0
+    if pending:
+        yield pending[0] if len(pending) == 1 else np.concatenate(pending)
+
+
+# Decoding of uploads and describing the results
+# -------------------------------------------------------------------
+# Decodes an uploaded clip into a mono float32 signal in [-1, 1] and returns it with its samplerate.
+# - sample_format None: a PCM WAV file
+# - sample_format in 'raw_sample_formats': headerless interleaved samples; 'samplerate' is required
+# Raises ValueError with a message for the client if the clip can't be decoded.
+def decode_clip(data, sample_format=None, samplerate=None, channels=1):
+    if sample_format is None:
+        try:
+            return tuner_core.load_wav(io.BytesIO(data))
+        except (wave.Error, EOFError, KeyError, ValueError):
+            raise ValueError("not a readable PCM WAV file (or an unsupported sample width)")
+
+    if sample_format not in raw_sample_formats:
+        raise ValueError(f"unknown sample format '{sample_format}'")
+    if not samplerate or samplerate <= 0:
+        raise ValueError("raw PCM needs a positive 'samplerate'")
+    if channels < 1:
+        raise ValueError("'channels' must be at least 1")
+    dtype = np.dtype(raw_sample_formats[sample_format])
+    if len(data) % (dtype.itemsize * channels):
+        raise ValueError("the upload is not a whole number of sample frames")
+    samples = np.frombuffer(data, dtype=dtype).astype(np.float32)
+    if dtype.kind == 'i':
+        samples /= 2 ** (8 * dtype.itemsize - 1)
+    # Mix multichannel clips down to mono.
+    samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return samples, samplerate
+
+
+# Rounds an array into a list for JSON, with None in place of NaN.
+def json_values(values, digits):
+    return [None if value != value else value for value in np.round(values, digits).tolist()]
+
+
+# Describes the pitch track of a clip: the time, frequency, nearest note and cents deviation of every frame,
+# plus a summary of the whole clip (the median frequency of the frames with a pitch).
+# With 'tuning' (a list of {note: frequency} per string, as stored), every frame and the summary also get the
+# nearest string of the tuning and the deviation from it in cents.
+def describe_pitch_track(frequencies, samplerate, hop_size, a4=tuner_core.a4_reference, tuning=None):
+    voiced = frequencies > 0
+    notes, cents = tuner_core.frequency_to_note(frequencies, a4)
+    track = {'time': json_values(np.arange(len(frequencies)) * hop_size / samplerate, 4),
+             'frequency': json_values(np.where(voiced, frequencies, np.nan), 3),
+             'note': [str(note) or None for note in notes],
+             'cents': json_values(cents, 2)}
+
+    median = float(np.median(frequencies[voiced])) if voiced.any() else 0.0
+    summary_notes, summary_cents = tuner_core.frequency_to_note([median], a4)
+    summary = {'frequency': round(median, 3) if median else None,
+               'note': str(summary_notes[0]) or None,
+               'cents': json_values(summary_cents, 2)[0],
+               'voiced_frames': int(voiced.sum())}
+
+    if tuning is not None:
+        string_notes = [note for string in tuning for note in string]
+        targets = np.array([frequency for string in tuning for frequency in string.values()])
+        # Deviation of every frame (rows) from every string (columns)
+        deviation = np.full((len(frequencies), len(targets)), np.nan)
+        np.log2(frequencies[:, np.newaxis] / targets, out=deviation, where=voiced[:, np.newaxis])
+        deviation *= 1200
+        nearest = np.argmin(np.abs(np.nan_to_num(deviation, nan=np.inf)), axis=1)
+        track['string'] = [string_notes[string] if is_voiced else None for string, is_voiced in zip(nearest, voiced)]
+        track['string_cents'] = json_values(deviation[np.arange(len(frequencies)), nearest], 2)
+        if median:
+            median_deviation = 1200 * np.log2(median / targets)
+            string = int(np.argmin(np.abs(median_deviation)))
+            summary['string'] = string_notes[string]
+            summary['string_cents'] = round(float(median_deviation[string]), 2)
+        else:
+            summary['string'] = summary['string_cents'] = None
+
+    return {'track': track, 'summary': summary}
@@ -0,0 +1,263 @@
+import argparse
+import csv
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import tuner_core
+
+
+# ***************************
+# *    Global variables     *
+# ***************************
+# Benchmark settings
+# -------------------------------------------------------------------
+# File with the tunings whose notes are synthesised
+tunings_file = 'tunings.csv'
+
+# Combinations that are measured (overridable from the command line)
+window_sizes = [2048, 4096, 8192]
+samplerates = [44100, 48000]
+
+# Synthetic pluck
+pluck_seconds = 2.0       # sec - Length of every synthetic pluck
+onset_seconds = 0.25      # sec - Noise before the string is plucked (the time-to-lock clock starts at the pluck)
+string_decay = 0.996      # Loss per period of the Karplus-Strong loop (lower = shorter sustain)
+max_detune = 30           # cents - Plucks are detuned by a random amount up to this much
+noise_level = 0.01        # Amplitude of the white noise added to every pluck (full scale = 1)
+min_snr = 20              # dB - Accuracy is only measured on windows where the string is this much above the noise
+
+# Live simulation
+hop_size = 512            # samples - Hop between two readings, as in the tuner
+lock_tolerance = 5        # cents - A reading within this much of the true pitch counts as locked
+lock_hold = 3             # Readings in a row that have to be locked before the tuner counts as locked
+
+# CPU / allocation measurement
+timing_repeats = 50       # Windows analysed to measure the CPU time per window
+
+# Regression check against a baseline report
+max_error_increase = 1.0  # cents - Allowed increase of the 95th percentile error
+max_cpu_ratio = 1.5       # Allowed slow-down of the mean CPU time per window
+
+
+# ***************************
+# *        Functions        *
+# ***************************
+# Synthetic guitar signals
+# -------------------------------------------------------------------
+# Loads the unique (note, frequency) pairs of all tunings in 'tunings.csv', sorted by frequency.
+def load_notes(file_path=tunings_file):
+    notes = {}
+    with open(file_path, 'r') as file:
+        for row in csv.reader(file):
+            for i in range(1, len(row), 2):
+                notes[row[i]] = float(row[i + 1])
+    return sorted(notes.items(), key=lambda item: item[1])
+
+
+# Synthesises a plucked string with the Karplus-Strong algorithm.
+# The loop delays a burst of noise by 'period' samples and averages neighbouring samples, which acts as a
+# low-pass filter: the harmonics die away faster than the fundamental, like on a real string.
+# The averaging adds half a sample of delay, so the pitch is exactly samplerate / (period + 0.5).
+# Returns the signal and its true pitch in Hz.
+def karplus_strong(frequency, samplerate, seconds, rng, decay=string_decay):
+    period = max(int(round(samplerate / frequency - 0.5)), 2)
+    length = int(seconds * samplerate)
+    signal = np.zeros(length + period + 1)
+    signal[:period + 1] = rng.uniform(-1, 1, period + 1)
+    # Every period only depends on the previous one, so it is computed one period at a time.
+    for start in range(period + 1, len(signal), period):
+        end = min(start + period, len(signal))
+        signal[start:end] = 0.5 * decay * (signal[start - period:end - period] +
+                                           signal[start - period - 1:end - period - 1])
+    signal = signal[period + 1:]
+    return signal / np.abs(signal).max(), samplerate / (period + 0.5)
+
+
+# Builds the test signal for one note: noise, then a detuned pluck with added noise.
+# Returns the signal, the pluck without noise, the true pitch and the index of the first sample of the pluck.
+def synthesize_note(frequency, samplerate, rng):
+    detuned = frequency * 2 ** (rng.uniform(-max_detune, max_detune) / 1200)
+    pluck, true_frequency = karplus_strong(detuned, samplerate, pluck_seconds, rng)
+    onset = int(onset_seconds * samplerate)
+    clean = np.concatenate([np.zeros(onset), 0.5 * pluck])
+    signal = clean + noise_level * rng.standard_normal(len(clean))
+    return signal.astype(np.float32), clean, true_frequency, onset
+
+
+# Measurements
+# -------------------------------------------------------------------
+# Deviation of the estimated frequencies from the true pitch in cents (NaN where no pitch was found).
+def cents_error(frequencies, true_frequency):
+    frequencies = np.asarray(frequencies, dtype=np.float64)
+    error = np.full(frequencies.shape, np.nan)
+    np.log2(frequencies / true_frequency, out=error, where=frequencies > 0)
+    return 1200 * error
+
+
+# Time from the pluck until the readings first stay within 'lock_tolerance' cents for 'lock_hold' readings.
+# A reading is available at the end of its window, as in the live tuner. Returns None if it never locks.
+def time_to_lock(signal, true_frequency, onset, window, samplerate, method):
+    first = max(onset - window + hop_size, 0) // hop_size * hop_size
+    frames = tuner_core.frame_signal(signal[first:], window, hop_size)
+    locked = np.abs(cents_error(tuner_core.get_analyzer(window, samplerate).estimate(frames, method),
+                                true_frequency)) <= lock_tolerance
+    held = np.convolve(locked, np.ones(lock_hold, dtype=int), mode='valid') == lock_hold
+    if not held.any():
+        return None
+    frame_end = first + np.argmax(held) * hop_size + window
+    return (frame_end - onset) / samplerate
+
+
+# Measures the CPU time and the peak memory allocated per analysed window in steady state,
+# i.e. the way the live detection loop calls the analyzer (one window at a time).
+def window_cost(frame, samplerate, method):
+    analyzer = tuner_core.get_analyzer(len(frame), samplerate)
+    frames = frame[np.newaxis, :]
+    # Warm-up: the first call may allocate work buffers.
+    analyzer.estimate(frames, method)
+
+    times = []
+    for _ in range(timing_repeats):
+        start = time.process_time()
+        analyzer.estimate(frames, method)
+        times.append(time.process_time() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    analyzer.estimate(frames, method)
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return np.array(times) * 1000, peak
+
+
+# Summary statistics of an array, ignoring NaN values.
+def summary(values):
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    return {'mean': round(float(values.mean()), 4),
+            'median': round(float(np.median(values)), 4),
+            'p95': round(float(np.percentile(values, 95)), 4),
+            'max': round(float(values.max()), 4)}
+
+
+# Runs one combination of samplerate, window size and estimator over all notes.
+def run_case(notes, samplerate, window, method, seed):
+    rng = np.random.default_rng(seed)
+    errors, lock_times, unlocked, cpu_times, allocations = [], [], [], [], []
+    for note, frequency in notes:
+        signal, clean, true_frequency, onset = synthesize_note(frequency, samplerate, rng)
+
+        # Accuracy over the sustain of the note (one window every 'window' samples after the pluck),
+        # as long as the string is clearly louder than the noise
+        frames = tuner_core.frame_signal(signal[onset:], window, window)
+        clean_frames = tuner_core.frame_signal(clean[onset:], window, window)
+        snr = 10 * np.log10(np.mean(clean_frames ** 2, axis=-1) / noise_level ** 2 + 1e-12)
+        frames = frames[snr >= min_snr]
+        if len(frames):
+            estimates = tuner_core.get_analyzer(window, samplerate).estimate(frames, method)
+            errors.extend(np.abs(cents_error(estimates, true_frequency)))
+
+        lock = time_to_lock(signal, true_frequency, onset, window, samplerate, method)
+        if lock is None:
+            unlocked.append(note)
+        else:
+            lock_times.append(lock * 1000)
+
+        times, peak = window_cost(signal[onset:onset + window], samplerate, method)
+        cpu_times.extend(times)
+        allocations.append(peak)
+
+    return {'samplerate': samplerate,
+            'window': window,
+            'method': method,
+            'error_cents': summary(errors),
+            'time_to_lock_ms': summary(lock_times),
+            'never_locked': unlocked,
+            'cpu_ms_per_window': summary(cpu_times),
+            'peak_alloc_bytes_per_window': int(max(allocations))}
+
+
+# Compares a report against a baseline report and returns a list of regressions.
+def find_regressions(report, baseline):
+    regressions = []
+    previous = {(case['samplerate'], case['window'], case['method']): case for case in baseline['results']}
+    for case in report['results']:
+        key = (case['samplerate'], case['window'], case['method'])
+        old = previous.get(key)
+        if old is None:
+            continue
+        name = f"{case['method']} @ {case['samplerate']} Hz / {case['window']} samples"
+        if case['error_cents'] and old['error_cents'] and \
+                case['error_cents']['p95'] > old['error_cents']['p95'] + max_error_increase:
+            regressions.append(f"{name}: p95 error {old['error_cents']['p95']} -> {case['error_cents']['p95']} cents")
+        if case['cpu_ms_per_window']['mean'] > old['cpu_ms_per_window']['mean'] * max_cpu_ratio:
+            regressions.append(f"{name}: CPU {old['cpu_ms_per_window']['mean']} -> "
+                               f"{case['cpu_ms_per_window']['mean']} ms per window")
+        if len(case['never_locked']) > len(old['never_locked']):
+            regressions.append(f"{name}: never locked on {', '.join(case['never_locked'])}")
+    return regressions
+
+
+# ***************************
+# *          MAIN           *
+# ***************************
+# -------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Accuracy, latency and CPU benchmark of the pitch estimators '
+                                                 'on synthetic plucked strings.')
+    parser.add_argument('--windows', type=int, nargs='+', default=window_sizes, help='window sizes in samples')
+    parser.add_argument('--samplerates', type=int, nargs='+', default=samplerates)
+    parser.add_argument('--methods', nargs='+', default=sorted(tuner_core.pitch_estimators),
+                        choices=sorted(tuner_core.pitch_estimators))
+    parser.add_argument('--tunings', default=tunings_file, help='CSV file with the tunings to synthesise')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random detune and noise')
+    parser.add_argument('--output', default='benchmark_report.json', help='where to write the JSON report')
+    parser.add_argument('--baseline', help='earlier JSON report; exit with status 1 on regressions')
+    args = parser.parse_args(argv)
+
+    notes = load_notes(args.tunings)
+    results = []
+    for samplerate in args.samplerates:
+        for window in args.windows:
+            for method in args.methods:
+                case = run_case(notes, samplerate, window, method, args.seed)
+                results.append(case)
+                error = case['error_cents'] or {}
+                lock = case['time_to_lock_ms'] or {}
+                print(f"{method:>4} {samplerate:>6} Hz {window:>6} samples | "
+                      f"error median {error.get('median', float('nan')):7.2f} p95 {error.get('p95', float('nan')):8.2f} cents | "
+                      f"lock median {lock.get('median', float('nan')):7.1f} ms | "
+                      f"cpu {case['cpu_ms_per_window']['mean']:6.3f} ms | "
+                      f"alloc {case['peak_alloc_bytes_per_window']:>8} B")
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'machine': platform.machine(),
+              'settings': {'notes': [note for note, frequency in notes], 'pluck_seconds': pluck_seconds,
+                           'max_detune_cents': max_detune, 'noise_level': noise_level, 'min_snr_db': min_snr,
+                           'hop_size': hop_size,
+                           'lock_tolerance_cents': lock_tolerance, 'lock_hold': lock_hold, 'seed': args.seed},
+              'results': results}
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = find_regressions(report, json.load(file))
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
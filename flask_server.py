@@ -1,6 +1,19 @@
-from flask import Flask, jsonify, render_template, request, redirect, url_for
-import csv
+from flask import Flask, Response, abort, jsonify, render_template, request, redirect, url_for
+from analysis_service import AnalysisService, decode_clip, describe_pitch_track, raw_sample_formats
+from tuner_core import a4_max, a4_min, a4_reference, pitch_estimators, tuning_notes
+from markupsafe import Markup
+from werkzeug.exceptions import RequestEntityTooLarge
+from tuning_store import TuningStore, parse_tunings_csv, parse_tunings_json, parse_tunings_ndjson, validate_tuning, \
+    write_tunings_csv
+import gzip
+import io
+import json
+import math
 import os
+import threading
+import time
+import zlib
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 
 # ***************************
@@ -8,33 +21,85 @@ import os
 # ***************************
 # -------------------------------------------------------------------
 # Tunings that load into 'tunings.csv' when it is first created
-# Each item in the list is a dictionary representing a tuning type and its corresponding notes with frequencies.
+# Each item in the list is a dictionary representing a tuning type and its corresponding notes with frequencies,
+# which are taken from the equal-temperament note table (A4 = 440 Hz).
 first_load_tunings = [
-    {"Standard":            [{"E2": 82.41}, {"A2": 110.00}, {"D3": 146.83},
-                             {"G3": 196.00}, {"B3": 246.94}, {"E4": 329.63}]},
-
-    {"Drop D":              [{"D2": 73.42}, {"A2": 110.00}, {"D3": 146.83},
-                             {"G3": 196.00}, {"B3": 246.94}, {"E4": 329.63}]},
-
-    {"E Flat Tuning":       [{"Eb2": 77.78}, {"Ab2": 103.83}, {"Db3": 138.59},
-                             {"Gb3": 184.99}, {"Bb3": 233.08}, {"Eb4": 311.13}]},
-
-    {"D Standard Tuning":   [{"D2": 73.42}, {"G2": 97.99}, {"C3": 130.81},
-                             {"F3": 174.61}, {"A3": 220.00}, {"D4": 293.66}]},
-
-    {"Open G Tuning":       [{"D2": 73.42}, {"G2": 97.99}, {"D3": 146.83},
-                             {"G3": 196.00}, {"B3": 246.94}, {"D4": 293.66}]},
-
-    {"Slash Tuning":        [{"Eb2": 77.78}, {"Ab2": 103.83}, {"Db3": 138.59},
-                             {"Gb3": 184.99}, {"Bb3": 233.08}, {"Eb4": 311.13}]}
+    {"Standard":            tuning_notes("E2", "A2", "D3", "G3", "B3", "E4")},
+    {"Drop D":              tuning_notes("D2", "A2", "D3", "G3", "B3", "E4")},
+    {"E Flat Tuning":       tuning_notes("Eb2", "Ab2", "Db3", "Gb3", "Bb3", "Eb4")},
+    {"D Standard Tuning":   tuning_notes("D2", "G2", "C3", "F3", "A3", "D4")},
+    {"Open G Tuning":       tuning_notes("D2", "G2", "D3", "G3", "B3", "D4")},
+    {"Slash Tuning":        tuning_notes("Eb2", "Ab2", "Db3", "Gb3", "Bb3", "Eb4")}
 ]
 
-# A list to store the current tunings loaded into the server.
-tunings = []
-
 # The file path where tunings are stored.
 tunings_file = 'tunings.csv'
 
+# Store holding the current tunings loaded into the server, indexed by tuning name.
+# Changes are appended to a journal next to 'tunings.csv', which is rewritten in the background.
+# Every server process has its own store; the stores share the files and pick up each other's changes
+# before every request (see TuningStore.refresh()).
+tunings = TuningStore(tunings_file, initial_tunings=first_load_tunings)
+
+# Pre-serialized '/api/tunings' response, rebuilt only when the version of the tunings store changes.
+# Holds the store version, the ETag, the JSON body and its gzip-compressed copy.
+api_tunings_cache = {'version': None}
+
+# Pre-serialized responses to '/api/tunings' requests with query parameters, keyed by the normalized parameters.
+# Cleared whenever the version of the tunings store changes; holds at most 'api_query_cache_size' entries.
+api_query_cache = {'version': None, 'responses': {}}
+api_query_cache_size = 256
+api_query_cache_lock = threading.Lock()
+
+# Responses smaller than this many bytes are not worth compressing.
+gzip_min_size = 512
+
+# Page size of '/api/tunings' when only 'offset' is given, and the largest page a client may ask for.
+default_page_size = 100
+max_page_size = 1000
+
+# Query parameters of '/api/tunings' (see get_tunings()).
+api_query_parameters = ('offset', 'limit', 'prefix', 'note', 'lowest_min', 'lowest_max', 'fields')
+
+# Bulk import / export
+# Formats of '/api/tunings/bulk' and '/api/tunings/export': format name -> (parser, MIME type).
+bulk_formats = {'csv': (parse_tunings_csv, 'text/csv'),
+                'ndjson': (parse_tunings_ndjson, 'application/x-ndjson'),
+                'json': (parse_tunings_json, 'application/json')}
+bulk_chunk_rows = 1000  # Tunings serialized per chunk of a streamed export
+bulk_max_errors = 20    # Invalid rows listed in the response to a bulk import
+
+# Change events ('/api/tunings/events')
+# Every open event stream keeps one worker thread busy, so run the server with threads, e.g. 'gunicorn --threads 8'.
+events_poll_interval = 1.0  # sec - How often a stream looks for changes made by other server processes
+events_heartbeat = 15       # sec - A comment is sent after this much silence, so proxies keep the connection open
+events_max_duration = 300   # sec - Streams are closed after this long; the client reconnects and resumes
+events_retry = 3000         # ms - Reconnection delay suggested to the clients
+
+# Tunings page ('/tunings')
+# Every tuning block is rendered once from '_tuning_block.html' and kept until the tuning changes, so a page
+# costs a join of cached fragments. Pages hold 'tunings_page_size' tunings; the next pages are loaded as the
+# user scrolls (see 'tunings.html').
+tuning_blocks = {}       # Tuning name -> (notes, rendered HTML block)
+tunings_page_size = 60
+
+# Static files linked with asset_url() carry a version of their content in the URL, so browsers may keep them
+# for 'static_max_age' seconds without checking again; a changed file gets a new URL.
+static_versions = {}     # File name -> (modification time, version)
+static_max_age = 365 * 24 * 3600
+
+# Pitch analysis ('/api/analyze')
+# Clips are analysed in a process pool that batches the clips of concurrent requests (see AnalysisService).
+analysis_service = AnalysisService()
+analyze_max_bytes = 16 * 1024 * 1024      # Largest upload accepted
+analyze_max_seconds = 60                  # sec - Longest clip accepted
+analyze_window_sizes = (2048, 4096, 8192, 16384)  # samples - Window sizes a client may choose
+analyze_timeout = 30                      # sec - A request gives up waiting for its result after this long
+
+# Largest request body accepted by any route: a clip with room for the multipart form around it (bulk imports
+# share the limit). Werkzeug stops reading a longer body, also one sent without a Content-Length (chunked).
+max_request_bytes = analyze_max_bytes + 64 * 1024
+
 
 # ***************************
 # *        Functions        *
@@ -42,46 +107,267 @@ tunings_file = 'tunings.csv'
 # Functions for handling tuning storage and retrieval.
 # -------------------------------------------------------------------
 # Function to load tunings from a CSV file
-# This function checks if a CSV file exists. If it doesn't,
-# it creates the file using 'first_load_tunings'.
-# If the file exists, it loads the tunings from the file into the 'tunings' list.
+# If the CSV file doesn't exist, it is created using 'first_load_tunings'.
+# If the file exists, the tunings are loaded from the file (and its journal) into the 'tunings' store.
 def load_tunings_from_csv():
-    # Loads tunings from a CSV file into the global 'tunings' list.
-    global tunings_file, first_load_tunings, tunings
-    file_path = tunings_file
-
-    # Check if the CSV file exists.
-    if not os.path.exists(file_path):
-        # If the file does not exist, set 'tunings' to 'first_load_tunings' and create the file.
-        tunings = first_load_tunings
-        export_tunings_to_csv()
-    else:
-        # If the file exists, read the tunings from the file.
-        with open(file_path, 'r') as file:
-            reader = csv.reader(file)
-            for row in reader:
-                # Each row represents a tuning, with the first element being the tuning
-                # name and subsequent elements being notes and frequencies.
-                tuning_name = row[0]
-                notes = [{row[i]: float(row[i + 1])} for i in range(1, len(row), 2)]
-                tunings.append({tuning_name: notes})
+    tunings.load()
 
 
 # Function to export/save tunings to a CSV file
-# This function writes the current tunings in the 'tunings' list to a CSV file.
+# This function writes all tunings in the 'tunings' store to the CSV file and clears the journal.
 def export_tunings_to_csv():
-    # Exports the current tunings to a CSV file.
-    global tunings, tunings_file
-    with open(tunings_file, 'w', newline='') as file:
-        writer = csv.writer(file)
-        for tuning in tunings:
-            for tuning_name, notes in tuning.items():
-                # Construct a row for each tuning, with the tuning name followed by note-frequency pairs.
-                row = [tuning_name]
-                for note in notes:
-                    for note_name, frequency in note.items():
-                        row.extend([note_name, frequency])
-                writer.writerow(row)
+    tunings.compact()
+
+
+# Functions for the web pages.
+# -------------------------------------------------------------------
+# Returns the HTML block of a tuning, rendering it only if the tuning changed since it was last rendered.
+# The cached notes are compared as well, so changes made by other server processes are picked up too.
+def get_tuning_block(tuning_name, notes):
+    cached = tuning_blocks.get(tuning_name)
+    if cached is None or cached[0] != notes:
+        cached = (notes, render_template('_tuning_block.html', tuning_name=tuning_name, notes=notes))
+        tuning_blocks[tuning_name] = cached
+    return cached[1]
+
+
+# Renders one page of tuning blocks, starting at 'offset' in store order.
+# Returns the HTML and the offset of the next page (None on the last page).
+def render_tuning_blocks(offset):
+    names = tunings.index().names
+    end = offset + tunings_page_size
+    blocks = []
+    for tuning_name in names[offset:end]:
+        notes = tunings.get(tuning_name)
+        # The tuning may have been deleted in the meantime.
+        if notes is not None:
+            blocks.append(get_tuning_block(tuning_name, notes))
+    # Drop the blocks of deleted tunings once they make up a good part of the cache.
+    if len(tuning_blocks) > 2 * len(names) + tunings_page_size:
+        for tuning_name in [tuning_name for tuning_name in tuning_blocks if tunings.get(tuning_name) is None]:
+            tuning_blocks.pop(tuning_name, None)
+    return Markup('\n'.join(blocks)), end if end < len(names) else None
+
+
+# Returns the URL of a static file with the version of its content, e.g. '/static/style.css?v=1a2b3c4d'.
+# Used in the templates instead of url_for('static', ...).
+def asset_url(filename):
+    file_path = os.path.join(app.static_folder, filename)
+    modified = os.stat(file_path).st_mtime_ns
+    cached = static_versions.get(filename)
+    if cached is None or cached[0] != modified:
+        with open(file_path, 'rb') as file:
+            cached = (modified, f"{zlib.crc32(file.read()):08x}")
+        static_versions[filename] = cached
+    return url_for('static', filename=filename, v=cached[1])
+
+
+# Functions for the API.
+# -------------------------------------------------------------------
+# Builds a cache entry for a serialized JSON response: the store version, the ETag, the body and its
+# gzip-compressed copy, plus extra response headers.
+def build_api_cache_entry(version, data, headers=None):
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return {'version': version,
+            # The checksum keeps ETags apart if the CSV file is replaced by hand without a version change,
+            # and tells the responses to different queries apart.
+            'etag': f"tunings-v{version}-{zlib.crc32(body):08x}",
+            'body': body,
+            'gzip': gzip.compress(body, compresslevel=6) if len(body) >= gzip_min_size else None,
+            'headers': headers or {}}
+
+
+# Returns the cached '/api/tunings' response, serializing and compressing the tunings again only after a change.
+# The cache dictionary is replaced as a whole, so concurrent requests never see a half-built entry.
+def get_api_tunings_cache():
+    global api_tunings_cache
+    cache = api_tunings_cache
+    version = tunings.version
+    if cache['version'] != version:
+        cache = build_api_cache_entry(version, tunings.as_list(),
+                                      {'X-Total-Count': str(len(tunings))})
+        api_tunings_cache = cache
+    return cache
+
+
+# Reads the query parameters of an '/api/tunings' request into a dictionary of typed values.
+# Raises ValueError with a message for the client if a parameter is invalid.
+def parse_api_query(args):
+    query = {}
+    for name in ('offset', 'limit'):
+        if name in args:
+            value = int(args[name])
+            if value < 0:
+                raise ValueError(f"'{name}' must not be negative")
+            query[name] = value
+    if query.get('limit') == 0:
+        # An empty page would never advance 'X-Next-Offset'.
+        raise ValueError("'limit' must be at least 1")
+    if 'limit' in query:
+        query['limit'] = min(query['limit'], max_page_size)
+    elif 'offset' in query:
+        query['limit'] = default_page_size
+    for name in ('prefix', 'note'):
+        if args.get(name):
+            query[name] = args[name]
+    for name in ('lowest_min', 'lowest_max'):
+        if name in args:
+            try:
+                value = float(args[name])
+            except ValueError:
+                value = math.nan
+            # float() also reads 'nan' and 'inf', which would match every tuning (or none).
+            if not math.isfinite(value):
+                raise ValueError(f"'{name}' must be a finite number")
+            query[name] = value
+    if 'fields' in args:
+        if args['fields'] not in ('all', 'names'):
+            raise ValueError("'fields' must be 'all' or 'names'")
+        query['fields'] = args['fields']
+    return query
+
+
+# Runs a query against the indexes of the tunings store and returns the cache entry of its response.
+# - The response body is a list of tunings ({name: notes}), or of names only with 'fields=names'.
+# - 'X-Total-Count' holds the number of matching tunings; 'X-Next-Offset' the offset of the next page, if any.
+def get_api_query_cache(query):
+    global api_query_cache
+    cache = api_query_cache
+    version = tunings.version
+    if cache['version'] != version:
+        cache = {'version': version, 'responses': {}}
+        api_query_cache = cache
+
+    key = tuple(sorted(query.items()))
+    entry = cache['responses'].get(key)
+    if entry is None:
+        index = tunings.index()
+        names = index.query(query.get('prefix'), query.get('note'),
+                            query.get('lowest_min'), query.get('lowest_max'))
+        offset = query.get('offset', 0)
+        end = len(names) if 'limit' not in query else offset + query['limit']
+        page = names[offset:end]
+        headers = {'X-Total-Count': str(len(names))}
+        if end < len(names):
+            headers['X-Next-Offset'] = str(end)
+        if query.get('fields') == 'names':
+            data = page
+        else:
+            data = [{tuning_name: tunings.get(tuning_name)} for tuning_name in page]
+        entry = build_api_cache_entry(index.version, data, headers)
+        with api_query_cache_lock:
+            # Oldest entries are dropped first (dictionaries keep insertion order).
+            if len(cache['responses']) >= api_query_cache_size:
+                cache['responses'].pop(next(iter(cache['responses'])), None)
+            cache['responses'][key] = entry
+    return entry
+
+
+# Reads the query parameters of an '/api/analyze' request into a dictionary of typed values.
+# Raises ValueError with a message for the client if a parameter is invalid.
+def parse_analyze_query(args):
+    query = {'format': args.get('format', 'wav'),
+             'window': int(args.get('window', 4096)),
+             'hop': int(args.get('hop', 2048)),
+             'method': args.get('method'),
+             'a4': float(args.get('a4', a4_reference)),
+             'samplerate': int(args['samplerate']) if 'samplerate' in args else None,
+             'channels': int(args.get('channels', 1)),
+             'tuning': args.get('tuning')}
+    if query['format'] != 'wav' and query['format'] not in raw_sample_formats:
+        raise ValueError(f"'format' must be one of: wav, {', '.join(raw_sample_formats)}")
+    if query['window'] not in analyze_window_sizes:
+        raise ValueError(f"'window' must be one of: {', '.join(map(str, analyze_window_sizes))}")
+    if not 0 < query['hop'] <= query['window']:
+        raise ValueError("'hop' must be between 1 and the window size")
+    if query['method'] is not None and query['method'] not in pitch_estimators:
+        raise ValueError(f"'method' must be one of: {', '.join(sorted(pitch_estimators))}")
+    if not a4_min <= query['a4'] <= a4_max:
+        raise ValueError(f"'a4' must be between {a4_min:g} and {a4_max:g} Hz")
+    return query
+
+
+# Returns the bulk format of a request: the 'format' query parameter, or else the format matching the
+# Content-Type header. Defaults to CSV.
+def get_bulk_format(default='csv'):
+    requested = request.args.get('format')
+    if requested is None:
+        mimetype = request.mimetype
+        requested = next((name for name, (parser, format_mimetype) in bulk_formats.items()
+                          if format_mimetype == mimetype), default)
+    return requested
+
+
+# Yields a streamed export of (tuning name, notes) pairs in chunks of 'bulk_chunk_rows' tunings.
+def generate_export(items, export_format):
+    for start in range(0, len(items), bulk_chunk_rows):
+        chunk = items[start:start + bulk_chunk_rows]
+        if export_format == 'csv':
+            text = io.StringIO()
+            write_tunings_csv(text, chunk)
+            yield text.getvalue()
+        elif export_format == 'ndjson':
+            yield ''.join(json.dumps({tuning_name: notes}, separators=(',', ':')) + '\n'
+                          for tuning_name, notes in chunk)
+        else:
+            yield ('[' if start == 0 else ',') + ','.join(json.dumps({tuning_name: notes}, separators=(',', ':'))
+                                                        for tuning_name, notes in chunk)
+    if export_format == 'json':
+        yield ']' if items else '[]'
+
+
+# Formats one Server-Sent Event. The event id is the tunings version, so a client that reconnects sends it
+# back in the 'Last-Event-ID' header and gets the changes it missed.
+def format_event(event, data, version):
+    return f"id: {version}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+# Yields the change events after the given version for '/api/tunings/events':
+# - 'put' (a tuning was added or replaced): {"version": 12, "name": "Drop D", "notes": [{"D2": 73.42}, ...]}
+# - 'delete' (a tuning was deleted): {"version": 13, "name": "Drop D"}
+# - 'reset' (the changes are no longer known, load all tunings again): {"version": 13}
+def generate_events(since):
+    yield f"retry: {events_retry}\n\n"
+    started = last_sent = time.monotonic()
+    while time.monotonic() - started < events_max_duration:
+        tunings.refresh()
+        changes = tunings.changes_since(since)
+        if changes is None:
+            since = tunings.version
+            yield format_event('reset', {'version': since}, since)
+            last_sent = time.monotonic()
+        elif changes:
+            for entry in changes:
+                data = {'version': entry['v'], 'name': entry['name']}
+                if entry['op'] == 'put':
+                    data['notes'] = entry['notes']
+                yield format_event(entry['op'], data, entry['v'])
+            since = changes[-1]['v']
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= events_heartbeat:
+            yield ": heartbeat\n\n"
+            last_sent = time.monotonic()
+        tunings.wait_for_change(since, events_poll_interval)
+
+
+# Sends a cache entry as a JSON response, or an empty '304 Not Modified' if the client already has it.
+# Clients that accept gzip get the pre-compressed body.
+def send_api_cache_entry(cache):
+    use_gzip = cache['gzip'] is not None and 'gzip' in request.accept_encodings
+    etag = cache['etag'] + ('-gzip' if use_gzip else '')
+    if request.if_none_match.contains(cache['etag']) or request.if_none_match.contains(cache['etag'] + '-gzip'):
+        response = Response(status=304)
+    else:
+        response = Response(cache['gzip'] if use_gzip else cache['body'], mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers.extend(cache['headers'])
+    response.headers['X-Tunings-Version'] = str(cache['version'])
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Clients may keep the response, but have to check with the ETag before using it again.
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 
 # ***************************
@@ -91,6 +377,26 @@ def export_tunings_to_csv():
 # -------------------------------------------------------------------
 # Flask web application instance
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = max_request_bytes
+app.add_template_global(asset_url)
+
+
+# Before every request: pick up the changes that other server processes made to the tunings.
+@app.before_request
+def refresh_tunings():
+    tunings.refresh()
+
+
+# After every request: static files requested with a version (see asset_url()) never change, so browsers and
+# proxies may keep them.
+@app.after_request
+def cache_static_files(response):
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code in (200, 304):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = static_max_age
+        response.cache_control.immutable = True
+    return response
 
 
 # Home route: Renders the main page of the web application
@@ -100,9 +406,26 @@ def about_site():
 
 
 # Tunings route: Renders the  page of the web application for displaying the list of guitar tunings.
+# - Shows one page of tunings, starting at '?offset=' (default 0); the next pages are loaded from
+#   '/tunings/blocks' as the user scrolls.
+# - The block of every tuning is cached (see get_tuning_block()).
 @app.route('/tunings')
 def tunings_site():
-    return render_template('tunings.html', tunings=tunings)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    blocks, next_offset = render_tuning_blocks(offset)
+    return render_template('tunings.html', tuning_blocks=blocks, next_offset=next_offset)
+
+
+# Tuning Blocks route: Returns the HTML blocks of the next page of tunings for the tunings page, e.g.
+# '/tunings/blocks?offset=60'. The 'X-Next-Offset' header holds the offset of the page after it, if any.
+@app.route('/tunings/blocks')
+def tuning_blocks_page():
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    blocks, next_offset = render_tuning_blocks(offset)
+    response = Response(blocks, mimetype='text/html')
+    if next_offset is not None:
+        response.headers['X-Next-Offset'] = str(next_offset)
+    return response
 
 
 # Add Tuning route: Renders the page where users can add a new tuning.
@@ -113,25 +436,191 @@ def add_tuning_site():
 
 # Save Tuning route: Handles the POST request to save a new tuning.
 # - Extracts tuning data from the form.
-# - Adds the new tuning to the global 'tunings' list.
-# - Saves the updated tunings list to the CSV file.
+# - Checks it like a bulk import (see validate_tuning()): every frequency has to match its note name;
+#   an invalid tuning gets a '400 Bad Request' with the reason.
+# - Adds the new tuning to the 'tunings' store (a tuning with the same name is replaced).
+# - The store appends the change to its journal.
 # - Redirects the user back to the home page.
 @app.route('/save_tuning', methods=['POST'])
 def save_tuning():
     tuning_name = request.form['tuningName']
-    notes = [{request.form[f'note{i}']: float(request.form[f'frequencyValue{i}'])} for i in range(1, 7)]
-    tunings.append({tuning_name: notes})
-
-    export_tunings_to_csv()
+    notes = [{request.form[f'note{i}']: request.form[f'frequencyValue{i}']} for i in range(1, 7)]
+    try:
+        notes = validate_tuning(tuning_name, notes)
+    except ValueError as error:
+        # Plain text, which the form shows as it is.
+        return f"Invalid tuning: {error}", 400, {'Content-Type': 'text/plain; charset=utf-8'}
+    tunings.put(tuning_name, notes)
+    tuning_blocks.pop(tuning_name, None)
 
     return redirect(url_for('tunings_site'))
 
 
 # API Tunings route: Provides a JSON representation of the current guitar tunings.
 # This can be used for API access to the tuning data.
+# - The response carries an ETag that changes whenever a tuning is saved or deleted.
+# - A request whose 'If-None-Match' header matches the current ETag gets an empty '304 Not Modified'.
+# - Clients that accept gzip get the pre-compressed body.
+# Optional query parameters (combined filters must all match):
+# - offset, limit: return one page of the results; 'X-Next-Offset' holds the offset of the next page
+# - prefix: tuning names starting with this text, e.g. ?prefix=drop
+# - note: tunings using this note on any string, e.g. ?note=D2
+# - lowest_min, lowest_max: tunings whose lowest string is in this range (Hz), e.g. ?lowest_max=75
+# - fields=names: return only the tuning names
 @app.route('/api/tunings', methods=['GET'])
 def get_tunings():
-    return jsonify(tunings)
+    if not any(name in request.args for name in api_query_parameters):
+        return send_api_cache_entry(get_api_tunings_cache())
+    try:
+        query = parse_api_query(request.args)
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    return send_api_cache_entry(get_api_query_cache(query))
+
+
+# API Bulk import route: Adds or replaces many tunings from one CSV, JSON or NDJSON upload.
+# - The format is given with '?format=csv|json|ndjson' or the Content-Type header.
+# - The upload is parsed as a stream, one tuning at a time, and every tuning is validated against the
+#   six-string layout of 'tunings.csv'.
+# - By default the import is all or nothing: if any row is invalid, nothing is saved and the response
+#   lists the invalid rows. With '?skip_invalid=1' the valid rows are saved and the invalid ones reported.
+# - All tunings are saved with a single journal write.
+@app.route('/api/tunings/bulk', methods=['POST'])
+def bulk_import_tunings():
+    import_format = get_bulk_format()
+    if import_format not in bulk_formats:
+        return jsonify(error=f"unknown format '{import_format}'"), 400
+    skip_invalid = request.args.get('skip_invalid', '0').lower() in ('1', 'true', 'yes')
+    parser = bulk_formats[import_format][0]
+
+    text_stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+    # Tunings with the same name in one upload: the last one wins, as if they were saved one by one.
+    valid = {}
+    errors = []
+    invalid = 0
+    try:
+        for line, tuning_name, notes, error in parser(text_stream):
+            if error is None:
+                valid.pop(tuning_name, None)
+                valid[tuning_name] = notes
+                continue
+            invalid += 1
+            if len(errors) < bulk_max_errors:
+                errors.append({'line': line, 'name': tuning_name, 'error': error})
+    except UnicodeDecodeError:
+        return jsonify(error="the upload is not UTF-8 text"), 400
+    except RequestEntityTooLarge:
+        return jsonify(error=f"the upload is larger than {max_request_bytes} bytes"), 413
+
+    if invalid and not skip_invalid:
+        return jsonify(imported=0, invalid=invalid, errors=errors), 400
+    imported = tunings.put_many(valid.items())
+    return jsonify(imported=imported, invalid=invalid, errors=errors, version=tunings.version)
+
+
+# API Export route: Streams all tunings as CSV (the 'tunings.csv' layout), JSON or NDJSON,
+# e.g. '/api/tunings/export?format=ndjson'. The response is sent in chunks while it is being serialized.
+@app.route('/api/tunings/export', methods=['GET'])
+def export_tunings():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in bulk_formats:
+        return jsonify(error=f"unknown format '{export_format}'"), 400
+    with tunings.lock:
+        items = tunings.items()
+        version = tunings.version
+    response = Response(generate_export(items, export_format), mimetype=bulk_formats[export_format][1])
+    response.headers['Content-Disposition'] = f'attachment; filename=tunings.{export_format}'
+    response.headers['X-Tunings-Version'] = str(version)
+    return response
+
+
+# API Events route: Streams changes of the tunings as Server-Sent Events (see generate_events()).
+# - Clients resume after the version in the 'Last-Event-ID' header (sent automatically on reconnects)
+#   or in '?since=<version>', usually the 'X-Tunings-Version' of their last '/api/tunings' response.
+# - Without either, only changes made after connecting are sent.
+@app.route('/api/tunings/events', methods=['GET'])
+def tunings_events():
+    since = request.headers.get('Last-Event-ID', request.args.get('since'))
+    try:
+        since = tunings.version if since is None else int(since)
+    except ValueError:
+        return jsonify(error="'since' must be a version number"), 400
+    response = Response(generate_events(since), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx-style proxies not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# API Analyze route: Finds the pitch of an uploaded clip (see parse_analyze_query() for the parameters).
+# - The clip is the request body, or the 'file' field of a multipart form.
+# - '?format=wav' (default) for a PCM WAV file, or '?format=s16le|s32le|f32le&samplerate=44100&channels=1'
+#   for raw little-endian samples.
+# - '?window=4096&hop=2048' set the analysis windows, '?method=fft|hps|yin' the estimator,
+#   '?a4=440' the reference pitch of the note names (432 - 446).
+# - '?tuning=<name>' also compares every frame with the strings of that stored tuning.
+# The response holds the pitch track (one value per frame) and a summary of the whole clip, e.g.
+#   {"samplerate": 44100, "window": 4096, "hop": 2048,
+#    "summary": {"frequency": 110.2, "note": "A2", "cents": 3.14, "voiced_frames": 20,
+#                "string": "A2", "string_cents": 3.14},
+#    "track": {"time": [0.0, ...], "frequency": [110.2, ...], "note": ["A2", ...], "cents": [3.14, ...],
+#              "string": ["A2", ...], "string_cents": [3.14, ...]}}
+@app.route('/api/analyze', methods=['POST'])
+def analyze_clip():
+    if request.content_length is not None and request.content_length > analyze_max_bytes:
+        return jsonify(error=f"the upload is larger than {analyze_max_bytes} bytes"), 413
+    try:
+        query = parse_analyze_query(request.args)
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    tuning = None
+    if query['tuning'] is not None:
+        tuning = tunings.get(query['tuning'])
+        if tuning is None:
+            return jsonify(error=f"unknown tuning '{query['tuning']}'"), 404
+
+    # Only a multipart form is parsed; any other body (e.g. curl --data-binary, sent as form-urlencoded) is the
+    # clip itself and must be read before something parses it as a form.
+    try:
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                return jsonify(error="the multipart form has no 'file' field"), 400
+            data = upload.read(analyze_max_bytes + 1)
+        else:
+            data = request.get_data(cache=False)
+    except RequestEntityTooLarge:
+        return jsonify(error=f"the upload is larger than {analyze_max_bytes} bytes"), 413
+    if len(data) > analyze_max_bytes:
+        return jsonify(error=f"the upload is larger than {analyze_max_bytes} bytes"), 413
+    try:
+        signal, samplerate = decode_clip(data, None if query['format'] == 'wav' else query['format'],
+                                         query['samplerate'], query['channels'])
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    if len(signal) > analyze_max_seconds * samplerate:
+        return jsonify(error=f"the clip is longer than {analyze_max_seconds} seconds"), 400
+
+    future = analysis_service.submit(signal, samplerate, query['window'], query['hop'], query['method'])
+    try:
+        frequencies = future.result(analyze_timeout)
+    except FutureTimeoutError:
+        return jsonify(error="the analysis took too long, try again later"), 503
+    except Exception as error:
+        app.logger.exception("analysis failed")
+        return jsonify(error=f"the analysis failed ({type(error).__name__})"), 503
+
+    result = describe_pitch_track(frequencies, samplerate, query['hop'], query['a4'], tuning)
+    return jsonify(samplerate=samplerate, window=query['window'], hop=query['hop'], **result)
+
+
+# API Tuning route: Provides the notes of a single tuning, e.g. '/api/tunings/Drop%20D'.
+@app.route('/api/tunings/<path:tuning_name>', methods=['GET'])
+def get_tuning(tuning_name):
+    notes = tunings.get(tuning_name)
+    if notes is None:
+        abort(404)
+    return jsonify({tuning_name: notes})
 
 
 # Shutdown route: Allows for a clean shutdown of the Flask application.
@@ -139,6 +628,7 @@ def get_tunings():
 @app.route('/shutdown', methods=['POST'])
 def shutdown():
     export_tunings_to_csv()
+    analysis_service.shutdown()
 
     # Flask-specific shutdown procedure
     func = request.environ.get('werkzeug.server.shutdown')
@@ -149,27 +639,33 @@ def shutdown():
 
 # Delete Tuning route: Handles the request to delete a specific guitar tuning.
 # - This route receives the name of the tuning to be deleted as a URL parameter.
-# - It then updates the global 'tunings' list by removing the specified tuning.
-# - After removal, it saves the updated list of tunings to the CSV file.
+# - It then removes the specified tuning from the 'tunings' store.
+# - The store appends the change to its journal.
 # - Finally, it redirects the user back to the home page where the updated list is displayed.
 @app.route('/delete_tuning/<tuning_name>')
 def delete_tuning(tuning_name):
-    global tunings
-    # Update the tunings list by filtering out the tuning that matches the given name.
-    tunings = [tuning for tuning in tunings if list(tuning.keys())[0] != tuning_name]
-
-    # Save the updated list of tunings to the CSV file.
-    export_tunings_to_csv()
+    # Remove the tuning with the given name.
+    tunings.delete(tuning_name)
+    tuning_blocks.pop(tuning_name, None)
 
     # Redirect the user back to the home page.
     return redirect(url_for('tunings_site'))
 
 
-# -------------------------------------------------------------------
-if __name__ == '__main__':
-    # Initialization when the script is run.
+# Application factory: loads the tunings and returns the application.
+# It runs when the module is imported, so every process serving the application starts with the stored
+# tunings - the development server as well as each worker of a WSGI server, e.g.
+#   gunicorn --workers 4 --threads 4 flask_server:app
+def create_app():
     # Load tunings from the CSV file or create a new file with default tunings.
     load_tunings_from_csv()
+    return app
+
+
+app = create_app()
 
+
+# -------------------------------------------------------------------
+if __name__ == '__main__':
     # Start the Flask application server.
     app.run(debug=True)
@@ -2,11 +2,22 @@
 from tkinter import ttk
 from tkinter import font
 import tkinter.messagebox as messagebox
-import sounddevice as sd
+import tkinter.filedialog as filedialog
 import numpy as np
+import json
+import os
 import threading
+import queue
+import time
+from bisect import bisect_left
 import requests
-from PIL import Image, ImageTk
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import quote
+from tuner_core import AdaptiveAnalyzer, CaptureEngine, MultiChannelTracker, PipelineMetrics, RingFileRecorder, \
+    WavSource, a4_max, a4_min, a4_reference, cents_between, get_analyzer, get_note_table, list_input_devices, \
+    tuning_notes
 
 
 # ***************************
@@ -15,10 +26,10 @@ from PIL import Image, ImageTk
 # Global variables - app settings
 # -------------------------------------------------------------------
 # Dictionary containing different guitar tunings with note names and their corresponding frequencies in Hz.
-# Local hardcoded tunings
+# Local hardcoded tunings - the frequencies are taken from the equal-temperament note table (A4 = 440 Hz)
 local_tunings = [
-    {"Standard":    [{"E2": 82.41}, {"A2": 110.00}, {"D3": 146.83}, {"G3": 196.00}, {"B3": 246.94}, {"E4": 329.63}]},
-    {"Drop D":      [{"D2": 73.42}, {"A2": 110.00}, {"D3": 146.83}, {"G3": 196.00}, {"B3": 246.94}, {"E4": 329.63}]}
+    {"Standard":    tuning_notes("E2", "A2", "D3", "G3", "B3", "E4")},
+    {"Drop D":      tuning_notes("D2", "A2", "D3", "G3", "B3", "E4")}
 ]
 
 # Server URL link where the app gets tunings (API)
@@ -27,27 +38,127 @@ local_server_link = 'http://localhost:5000/api/tunings'
 # Render
 render_server_link = 'https://myfirstapp-t5m7.onrender.com/api/tunings'
 
-# Duration for each audio capture cycle in seconds.
-# Lower = faster app but less precise
-# Higher = slower app but more precise
-detection_speed = 0.4  # sec
+# Server requests - run in a background thread, so a slow or sleeping server never freezes the GUI
+server_connect_timeout = 3.05  # sec - Time allowed to connect to the server
+server_read_timeout = 30       # sec - Time allowed for the answer (long enough for a sleeping Render server to start)
+server_retries = 3             # Retries of a failed request (connection errors and 502/503/504 answers)
+server_retry_backoff = 0.5     # sec - Delay before the first retry; doubles with every further retry
+
+# Offline cache of the server tunings
+# The last tunings loaded from every server are kept in this file and shown at once when the server is selected
+# (also at startup, and when the server cannot be reached). Tunings older than [server_cache_ttl] are checked
+# with the server in the background.
+server_cache_file = 'server_tunings_cache.json'
+server_cache_ttl = 3600        # sec - Cached tunings younger than this are used without asking the server
+
+# Live updates of the server tunings - changes are pushed by the server ('/api/tunings/events')
+server_events_timeout = 45       # sec - Silence (not even a heartbeat) after which the connection counts as lost
+server_events_max_backoff = 30   # sec - Longest delay between two reconnection attempts
+
+# Audio capture settings
+# The input stream runs continuously and writes into a ring buffer; the detection loop
+# analyses overlapping windows taken from that buffer.
+samplerate = 44100             # Hz
+# Adaptive analysis: right after a pluck the pitch is estimated from a short window for a quick reading; the window
+# grows as the note sustains for a finer, steadier reading. Nothing is analysed while no note is sounding.
+analysis_window_sizes = (2048, 4096, 8192, 16384)  # samples - ~46 ms to ~0.37 s at 44.1 kHz
+gate_open_level = -50          # dBFS - Quietest level that counts as a sounding note (the gate also stays above the noise floor)
+analysis_hop_size = 512        # samples - New audio between two readings (~86 readings per second)
+capture_buffer_seconds = 2.0   # sec - Length of the ring buffer holding the most recent audio
+
+# Record / replay - to reproduce what the tuner heard, e.g. when a problem is reported
+replay_file = None             # WAV file played (in a loop) instead of the input device, e.g. 'take.wav'; None = off
+replay_realtime = True         # True = play at the speed of the recording, False = as fast as the detection keeps up
+record_directory = None        # Directory the input is also recorded to, e.g. 'recordings'; None = off
+record_file_seconds = 60       # sec - Length of every recorded file
+record_max_files = 10          # Only the newest files are kept
+
+# Pitch estimation
+# Method used to estimate the pitch of each window - one of the keys of 'tuner_core.pitch_estimators':
+# 'fft' = strongest spectral peak, 'hps' = harmonic product spectrum, 'yin' = YIN autocorrelation
+pitch_estimator = 'yin'
+
+# All strings mode - measures every string of the selected tuning from one strum
+all_strings_window_size = 16384  # samples - Longer window so the low strings are resolved (~0.37 s at 44.1 kHz)
+string_level_threshold = -60     # dBFS - Strings quieter than this are shown as not sounding
+
+# Hexaphonic mode - every string has its own input channel (e.g. a hexaphonic pickup on a multichannel interface),
+# so all strings are tuned at the same time, each from its own signal
+hexaphonic_channels = (0, 1, 2, 3, 4, 5)  # Input channel of every string of the tuning (counted from 0), lowest string first
+
+# GUI refresh
+gui_refresh_interval = 33     # ms - How often the GUI shows the newest detection result (~30 frames per second)
+debug_refresh_interval = 500  # ms - How often the debug panel shows the performance metrics
 
 # Frequency indicator
-turn_indicator_green = 2  # Hz - Turns indicator green when input_frequency is within this much of target_frequency
-turn_indicator_red = 50   # Hz - Turns indicator red when input_frequency is this far from target_frequency
+# The thresholds are in cents (1/100 of a semitone), so they mean the same on the low and the high strings.
+turn_indicator_green = 5  # cents - Turns indicator green when input_frequency is within this much of target_frequency
+turn_indicator_red = 50   # cents - Turns indicator red when input_frequency is this far from target_frequency
+
+# Reference pitch
+# The tunings are stored for A4 = 440 Hz; the strings are retuned to this pitch of A4 (can also be set in the GUI).
+a4_frequency = 440.0      # Hz - 432 to 446 Hz
 
 
 # Other global variables - DO NOT MODIFY
 # -------------------------------------------------------------------
+# Equal-temperament note table for the selected pitch of A4, used to name the detected notes.
+note_table = get_note_table(a4_frequency)
+
 # Server tunings - are loded in with the API
+# Only the tuning names are loaded at first ({name: None}); the notes of a tuning are fetched when it is selected.
 server_tunings = []
 
+# API URL the server tunings were loaded from; None while the local tunings are used.
+server_tunings_url = None
+
+# HTTP session shared by all server requests; keeps connections to the server open between requests.
+http_session = None
+
+# Background thread running the server requests.
+server_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='server')
+
+# Number of the latest request for the list of server tunings. A response to an older request (e.g. after
+# the user switched back to 'Local' while it was loading) is ignored.
+server_fetch_id = 0
+
+# Functions to be run on the Tk thread, put here by background threads (see run_ui_tasks()).
+ui_tasks = queue.Queue()
+
+# Live updates: server URL followed by the event thread, and the threading.Event that stops that thread.
+# None when no server is followed.
+tuning_events_url = None
+tuning_events_stop = None
+
+# Last response of every server URL: {url: {'etag': ..., 'version': ..., 'loaded': ..., 'tunings': [...]}}.
+# 'loaded' is the time (time.time()) the tunings were last confirmed by the server, 'version' the tunings
+# version of the server. The ETag is sent back on the next load, so an unchanged catalog is not transferred again.
+# Saved to [server_cache_file] together with the selected tunings source.
+server_tunings_cache = {}
+
 # Tunings currently used by the app
 tunings = []
 
 # List of string buttons
 string_buttons = []
 
+# List of labels next to the string buttons, showing each string's deviation in 'All strings' mode
+string_status_labels = []
+
+# Frequencies of the strings of the selected tuning, read by the detection thread in 'All strings' mode.
+string_targets = ()
+
+# Index of the strings of the selected tuning, sorted by frequency, used to find the string nearest to a
+# detected pitch with a binary search. Lists of frequencies and the matching (note, frequency) pairs.
+string_index_frequencies = []
+string_index_notes = []
+
+# Tuner mode: 'single' = tune the string chosen with the string buttons,
+# 'auto' = like 'single', but the string nearest to the played note is chosen automatically,
+# 'all' = measure all strings of the selected tuning at once from one strum,
+# 'hex' = measure every string from its own input channel ([hexaphonic_channels]).
+tuner_mode = 'single'
+
 # List of available input devices for audio capture.
 input_devices = ["Device1"]
 
@@ -60,10 +171,37 @@ input_frequency = 0
 # Global variable for the thread used in detection; initialized to None.
 detection_thread = None
 
+# Global variable for the audio capture engine; created when detection starts.
+capture_engine = None
+
+# Audio source played instead of the input device ([replay_file]), and the recorder of the input
+# ([record_directory]); created together with the capture engine. None when not used.
+replay_source = None
+input_recorder = None
+
 # Global variable to control the state of the audio detection process.
-# It is used as a flag to start or stop the continuous detection in a separate thread.
-# When set to True, the detection process runs; when set to False, the detection stops.
-continue_detection = False
+# Every detection run gets its own threading.Event; setting it tells that run's thread to stop.
+# None when no detection is running.
+detection_stop_event = None
+
+# Index of the input device selected in the GUI.
+# Set from the Tk thread and only read by the detection thread, which must not touch Tk variables.
+selected_device_index = None
+
+# Queue carrying detection results from the detection thread to the GUI.
+# Each item is a tuple (stop_event, kind, value, window_time, publish_time); the stop event identifies the
+# run it belongs to. kind 'pitch' carries the dominant frequency, kind 'strings' carries
+# (targets, frequencies, levels), kind 'silence' (no value) tells that the note has faded out.
+# The times (time.perf_counter) are used for the performance metrics.
+# The queue is small on purpose: when the GUI falls behind, the oldest results are dropped.
+detection_results = queue.Queue(maxsize=8)
+
+# Performance metrics of the capture -> analysis -> display pipeline, shown in the debug panel.
+pipeline_metrics = PipelineMetrics()
+
+# Debug panel window and its label; None while the panel is closed.
+debug_window = None
+debug_label = None
 
 # Global Variable where the app gets the tunings
 tunings_list_source = None  # Default to 'Local'
@@ -74,59 +212,327 @@ tunings_list_source = None  # Default to 'Local'
 # ***************************
 # Server Functions
 # -------------------------------------------------------------------
+# Creates the HTTP session for the server requests: connections are kept open and reused, and failed
+# requests are retried with exponential backoff.
+def create_http_session():
+    retry = Retry(total=server_retries, backoff_factor=server_retry_backoff,
+                  status_forcelist=(502, 503, 504), allowed_methods=('GET',))
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# Sends a GET request with the session, in a background thread. Returns the response.
+def server_get(url, **kwargs):
+    global http_session
+    if http_session is None:
+        http_session = create_http_session()
+    return http_session.get(url, timeout=(server_connect_timeout, server_read_timeout), **kwargs)
+
+
+# Runs a function in the background thread and calls 'on_done(future)' on the Tk thread when it has finished.
+def run_in_background(on_done, function, *args):
+    future = server_executor.submit(function, *args)
+    future.add_done_callback(lambda future: ui_tasks.put(lambda: on_done(future)))
+
+
+# Runs the functions put on 'ui_tasks' by background threads. Called from the Tk polling loop.
+def run_ui_tasks():
+    while True:
+        try:
+            task = ui_tasks.get_nowait()
+        except queue.Empty:
+            return
+        task()
+
+
+# Offline cache functions
+# -------------------------------------------------------------------
+# Loads the offline cache of the server tunings. Returns the tunings source selected when the app was
+# last used ('Local' if there is no cache).
+def load_server_cache():
+    global server_tunings_cache
+    try:
+        with open(server_cache_file, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        server_tunings_cache = data['servers']
+        return data['source']
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print("Offline tunings cache not loaded:", e)
+        return "Local"
+
+
+# Saves the offline cache and the selected tunings source. The file is written to a temporary file first
+# and then renamed, so a crash never leaves a half-written cache behind.
+def save_server_cache():
+    # Nothing to save before the first server has been used
+    if not server_tunings_cache and not os.path.exists(server_cache_file):
+        return
+    try:
+        with open(server_cache_file + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({'source': tunings_list_source.get(), 'servers': server_tunings_cache}, file)
+        os.replace(server_cache_file + '.tmp', server_cache_file)
+    except OSError as e:
+        print("Offline tunings cache not saved:", e)
+
+
 # Function to Load Tunings from Server
+# Only the names of the tunings are loaded; the notes of a tuning are fetched when it is selected
+# (see load_server_tuning()).
+# Tunings cached from this server are shown at once. The request runs in the background (if the cached
+# tunings are older than [server_cache_ttl], or there are none): the current tunings stay usable until the
+# answer arrives in show_server_tunings().
 def load_server_tunings(url):
-    global server_tunings, tunings
+    global server_fetch_id, server_tunings, server_tunings_url, tunings
+    server_fetch_id += 1
+    fetch_id = server_fetch_id
+    cached = server_tunings_cache.get(url)
+    if cached:
+        server_tunings = cached['tunings']
+        server_tunings_url = url
+        tunings = server_tunings
+        update_combobox()
+        subscribe_tuning_events(url)
+        if time.time() - cached['loaded'] < server_cache_ttl:
+            return
+    # If the tunings were loaded from this URL before, send their ETag along: the server then answers
+    # '304 Not Modified' without a body if nothing has changed.
+    headers = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else {}
+    root.title("Guitar Tuner - loading tunings...")
+    run_in_background(lambda future: show_server_tunings(fetch_id, url, future),
+                      lambda: server_get(url, params={'fields': 'names'}, headers=headers))
+
+
+# Uses the tunings loaded by load_server_tunings(). Runs on the Tk thread.
+def show_server_tunings(fetch_id, url, future):
+    global server_tunings, server_tunings_url, tunings
+    # A newer request has been made in the meantime.
+    if fetch_id != server_fetch_id:
+        return
+    root.title("Guitar Tuner")
+    cached = server_tunings_cache.get(url)
     try:
-        # Make an HTTP GET request to the specified URL which is the API endpoint for guitar tunings.
-        response = requests.get(url)
-        if response.status_code == 200:
+        # The HTTP GET request to the API endpoint for guitar tunings, made in the background thread.
+        response = future.result()
+        if response.status_code == 304:
             print("-" * 22 + "\nConnected to server!\n" + "-" * 22)
-            # Parse the JSON response from the server into a Python dictionary.
-            server_tunings = response.json()
-            # Use server tunings in the app
-            tunings = server_tunings
+            print("Tunings not modified since the last load.")
+            # The cached tunings, already shown, are still up to date.
+            cached['loaded'] = time.time()
+            save_server_cache()
+            return
+        elif response.status_code == 200:
+            print("-" * 22 + "\nConnected to server!\n" + "-" * 22)
+            version = response.headers.get('X-Tunings-Version')
+            version = int(version) if version else None
+            # The cached tunings may already be newer, patched by live updates received in the meantime.
+            if cached and cached.get('version') is not None and version is not None and version < cached['version']:
+                return
+            # Parse the JSON list of tuning names; the notes are not known yet.
+            server_tunings = [{tuning_name: None} for tuning_name in response.json()]
+            # Remember the response for the next load, also after a restart
+            server_tunings_cache[url] = {'etag': response.headers.get('ETag'),
+                                         'version': version,
+                                         'loaded': time.time(),
+                                         'tunings': server_tunings}
+            save_server_cache()
 
             # Print imported tunings to the console.
             print("Tunings imported:")
-            for tuning_dict in tunings:
-                for tuning_name, notes_list in tuning_dict.items():
-                    print(f"{tuning_name:22}:", notes_list)
+            for tuning_dict in server_tunings:
+                for tuning_name in tuning_dict:
+                    print(f"  {tuning_name}")
         else:
-            print("ERROR! - Server response status code:", response.status_code)
-            messagebox.showerror("Connection Error", f"Server response status code:\n{response.status_code}")
-            # Set radio button back to Local
-            tunings_list_source.set("Local")
-            update_tunings()
-    except requests.exceptions.RequestException as e:
+            raise requests.exceptions.HTTPError(f"Server response status code: {response.status_code}",
+                                                response=response)
+    except (requests.exceptions.RequestException, ValueError) as e:
         print("\nERROR! - Failed to connect to server\nDetails:")
         print(e)
+        if cached:
+            # Offline: keep using the cached tunings, which are already shown.
+            print("Using the tunings cached from the last connection.")
+            root.title("Guitar Tuner - offline")
+            return
         messagebox.showerror("Connection Error",
                              f"Failed to connect to the server. Tuning will be loaded from 'Local'.\n\nDetails:\n{e}")
         # Set radio button back to Local
         tunings_list_source.set("Local")
         update_tunings()
+        return
+    # Use server tunings in the app
+    server_tunings_url = url
+    tunings = server_tunings
+    update_combobox()
+    subscribe_tuning_events(url)
+
+
+# Live update functions
+# -------------------------------------------------------------------
+# Starts following the changes of the tunings on the server at 'url' in a background thread,
+# resuming after the version of the cached tunings. Stops following any other server.
+def subscribe_tuning_events(url):
+    global tuning_events_url, tuning_events_stop
+    if tuning_events_url == url:
+        return
+    unsubscribe_tuning_events()
+    tuning_events_url = url
+    tuning_events_stop = threading.Event()
+    threading.Thread(target=follow_tuning_events, args=(url, server_tunings_cache[url].get('version'),
+                                                        tuning_events_stop), daemon=True).start()
+
+
+# Stops following the changes of the server tunings.
+def unsubscribe_tuning_events():
+    global tuning_events_url, tuning_events_stop
+    if tuning_events_stop is not None:
+        tuning_events_stop.set()
+    tuning_events_url = None
+    tuning_events_stop = None
+
+
+# Reads the Server-Sent Events stream '<url>/events' in a background thread and hands every event to
+# apply_tuning_event() on the Tk thread. Reconnects with exponential backoff when the connection is lost,
+# sending the version of the last event received ('Last-Event-ID'), so no change is missed.
+def follow_tuning_events(url, since, stop_event):
+    delay = 1
+    while not stop_event.is_set():
+        try:
+            headers = {'Accept': 'text/event-stream'}
+            if since is not None:
+                headers['Last-Event-ID'] = str(since)
+            with requests.get(f"{url}/events", headers=headers, stream=True,
+                              timeout=(server_connect_timeout, server_events_timeout)) as response:
+                response.raise_for_status()
+                delay = 1
+                event, data = 'message', []
+                for line in response.iter_lines(chunk_size=1024, decode_unicode=True):
+                    if stop_event.is_set():
+                        return
+                    if line:
+                        # 'field: value' lines; lines starting with ':' are comments (heartbeats)
+                        field, _, value = line.partition(':')
+                        value = value[1:] if value.startswith(' ') else value
+                        if field == 'event':
+                            event = value
+                        elif field == 'data':
+                            data.append(value)
+                        elif field == 'id':
+                            since = int(value)
+                    elif data:
+                        # An empty line ends the event.
+                        payload = json.loads('\n'.join(data))
+                        ui_tasks.put(lambda event=event, payload=payload:
+                                     apply_tuning_event(url, event, payload, stop_event))
+                        event, data = 'message', []
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print("Live tuning updates interrupted, reconnecting:", e)
+        stop_event.wait(delay)
+        delay = min(delay * 2, server_events_max_backoff)
+
+
+# Applies one change event of the server tunings to the cached tunings and, if they are shown, to the
+# combobox. Runs on the Tk thread.
+def apply_tuning_event(url, event, payload, stop_event):
+    global tunings
+    # The event belongs to a server that is no longer followed.
+    if stop_event is not tuning_events_stop:
+        return
+    cached = server_tunings_cache.get(url)
+    if cached is None:
+        return
+    if event == 'reset':
+        # The server no longer knows the changes since our version: load all tunings again.
+        cached['loaded'] = 0
+        if url == server_tunings_url:
+            load_server_tunings(url)
+        return
+    if event not in ('put', 'delete') or \
+            (cached.get('version') is not None and payload['version'] <= cached['version']):
+        return
+
+    tuning_name = payload['name']
+    tuning_dict = next((item for item in cached['tunings'] if tuning_name in item), None)
+    if event == 'put':
+        if tuning_dict is None:
+            cached['tunings'].append({tuning_name: payload['notes']})
+        else:
+            tuning_dict[tuning_name] = payload['notes']
+    elif tuning_dict is not None:
+        cached['tunings'].remove(tuning_dict)
+    cached['version'] = payload['version']
+    cached['loaded'] = time.time()
+    save_server_cache()
+    print(f"Tuning {'updated' if event == 'put' else 'deleted'} on the server: {tuning_name}")
+
+    if url == server_tunings_url:
+        tunings = cached['tunings']
+        if tuning_combobox.get() == tuning_name:
+            # The selected tuning changed: show its new strings (or the first tuning, if it was deleted).
+            update_combobox()
+        else:
+            tuning_combobox.config(values=[list(tuning.keys())[0] for tuning in tunings])
+
+
+# Function to Load the Notes of one Server Tuning
+# Fetches the notes of the given tuning from '<url>/<tuning name>' in the background and stores them in its
+# dictionary in 'tunings'. The string buttons are updated when the notes arrive, if the tuning is still selected.
+def load_server_tuning(tuning_dict, tuning_name):
+    url = f"{server_tunings_url}/{quote(tuning_name, safe='')}"
+    root.title("Guitar Tuner - loading tuning...")
+    run_in_background(lambda future: show_server_tuning(tuning_dict, tuning_name, future), server_get, url)
+
+
+# Stores the notes loaded by load_server_tuning(). Runs on the Tk thread.
+def show_server_tuning(tuning_dict, tuning_name, future):
+    root.title("Guitar Tuner")
+    try:
+        response = future.result()
+        response.raise_for_status()
+        tuning_dict[tuning_name] = response.json()[tuning_name]
+        print(f"{tuning_name:22}:", tuning_dict[tuning_name])
+        # Keep the notes for offline use
+        save_server_cache()
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print("\nERROR! - Failed to load tuning from server\nDetails:")
+        print(e)
+        messagebox.showerror("Connection Error", f"Failed to load the tuning '{tuning_name}'.\n\nDetails:\n{e}")
+        return
+    if tuning_combobox.get() == tuning_name and any(item is tuning_dict for item in tunings):
+        update_string_buttons(tuning_name)
 
 
 # GUI Functions
 # -------------------------------------------------------------------
 # Updates the text on string buttons based on the selected tuning.
 def update_string_buttons(tuning_name):
-    global string_buttons
+    global string_buttons, string_targets, string_index_frequencies, string_index_notes
     # Find the dictionary for the given tuning name.
     tuning_dict = next((item for item in tunings if tuning_name in item), None)
+    # Server tunings are listed by name only; their notes are fetched the first time they are selected.
+    # The buttons of the previous tuning stay until the notes have arrived.
+    if tuning_dict and tuning_dict[tuning_name] is None:
+        load_server_tuning(tuning_dict, tuning_name)
+        return
     if tuning_dict:
-        # Clear the previous buttons
+        # Clear the previous buttons and string status labels
         for btn in string_buttons:
             btn.grid_forget()
         string_buttons.clear()
+        for label in string_status_labels:
+            label.grid_forget()
+        string_status_labels.clear()
 
         # Reset the target note display
         global target_frequency
         target_frequency = {'note': 'Note', 'frequency': 0.00}
         target_note_label.config(text=f"{target_frequency['note']} - {target_frequency['frequency']:.2f} Hz")
 
-        notes_list = tuning_dict[tuning_name]
+        # Stored frequencies are for A4 = 440 Hz; retune them to the selected pitch of A4.
+        notes_list = [{note: freq * note_table.a4 / a4_reference for note, freq in note_dict.items()}
+                      for note_dict in tuning_dict[tuning_name]]
 
         # Create new buttons for the selected tuning
         for i, note_dict in enumerate(notes_list):
@@ -137,6 +543,17 @@ def update_string_buttons(tuning_name):
                                 command=lambda note=note, freq=freq: string_button_click(note, freq))
                 btn.grid(row=4 + i, column=1, sticky="ew", padx=[0,5])
                 string_buttons.append(btn)
+                # Label showing this string's deviation in 'All strings' mode
+                status_label = tk.Label(root, text="", bg='black', fg='white', font=custom_font)
+                status_label.grid(row=4 + i, column=2, sticky="w")
+                string_status_labels.append(status_label)
+
+        # Strings measured in 'All strings' mode
+        string_targets = tuple(freq for note_dict in notes_list for freq in note_dict.values())
+        # Sorted string index for 'Auto' mode
+        sorted_notes = sorted(((freq, note) for note_dict in notes_list for note, freq in note_dict.items()))
+        string_index_frequencies = [freq for freq, note in sorted_notes]
+        string_index_notes = [(note, freq) for freq, note in sorted_notes]
 
 
 # Handles the event when a string button is clicked.
@@ -158,25 +575,72 @@ def string_button_click(note, freq):
     target_note_label.config(text=f"{note} - {freq:.2f} Hz")
 
 
+# Returns the (note, frequency) of the string of the selected tuning nearest to the given frequency,
+# or None if there are no strings. Uses a binary search over the sorted string index and compares
+# the two neighbouring strings by their frequency ratio, which matches how far apart notes sound.
+def find_nearest_string(frequency):
+    if not string_index_frequencies or frequency <= 0:
+        return None
+    i = bisect_left(string_index_frequencies, frequency)
+    if i == 0:
+        return string_index_notes[0]
+    if i == len(string_index_frequencies):
+        return string_index_notes[-1]
+    lower, upper = string_index_frequencies[i - 1], string_index_frequencies[i]
+    return string_index_notes[i - 1] if frequency / lower < upper / frequency else string_index_notes[i]
+
+
+# Handles a change of the pitch of A4: the strings of the selected tuning are retuned to it.
+def update_a4(event=None):
+    global note_table
+    try:
+        a4 = min(max(float(a4_var.get()), a4_min), a4_max)
+    except ValueError:
+        a4 = note_table.a4
+    a4_var.set(f"{a4:g}")
+    if a4 != note_table.a4:
+        note_table = get_note_table(a4)
+        update_string_buttons(tuning_var.get())
+
+
+# Handles the selection of the tuner mode ('single', 'auto' or 'all').
+def update_tuner_mode():
+    global tuner_mode
+    tuner_mode = tuner_mode_var.get()
+    # Clear the string status labels when leaving 'All strings' mode.
+    for label in string_status_labels:
+        label.config(text="")
+
+
 # Function to Update Tunings Based on Radio Button Selection
+# The server tunings are loaded in the background and shown in the combobox once they have arrived.
 def update_tunings():
-    global tunings, local_server_link, render_server_link
+    global tunings, server_tunings_url, server_fetch_id, local_server_link, render_server_link
     source = tunings_list_source.get()
     if source == "Local":
+        # Ignore the answer to a server request that is still running.
+        server_fetch_id += 1
+        root.title("Guitar Tuner")
         tunings = local_tunings
+        server_tunings_url = None
+        unsubscribe_tuning_events()
+        update_combobox()
     elif source == "Local Server":
         load_server_tunings(local_server_link)
     elif source == "Render Server":
         load_server_tunings(render_server_link)
-    update_combobox()
+    # Remember the selected source for the next start
+    save_server_cache()
 
 
 # Function to Update Combobox with New Tunings
+# The selected tuning stays selected if it is in the new list.
 def update_combobox():
     tuning_names = [list(tuning.keys())[0] for tuning in tunings]
     tuning_combobox.config(values=tuning_names)
     if tuning_names:
-        tuning_combobox.current(0)
+        selected = tuning_combobox.get()
+        tuning_combobox.current(tuning_names.index(selected) if selected in tuning_names else 0)
         update_string_buttons(tuning_combobox.get())
 
 
@@ -185,112 +649,350 @@ def update_combobox():
 # Retrieves and lists all available input devices with audio input capabilities.
 def get_input_devices():
     global input_devices
-    devices = sd.query_devices()
     # Creating a list of input device names along with their index for unique identification.
-    input_devices = [f"{device['name']} [{index}]" for index, device in enumerate(devices) if
-                     device['max_input_channels'] > 0]
+    input_devices = [f"{name} [{index}]" for index, name, channels in list_input_devices()]
 
 
-# Functions for audio signal processing
+# Functions for controlling frequency detection
 # -------------------------------------------------------------------
-# Records audio for a specified duration and samplerate.
-def record_audio(duration=1.0, samplerate=44100):
-    # Set the samplerate and channel configuration for recording.
-    sd.default.samplerate = samplerate
-    sd.default.channels = 1
-    # Record audio for the given duration and return the recording.
-    recording = sd.rec(int(duration * samplerate))
-    sd.wait()  # Wait until the recording is finished
-    return recording
-
-
-# Calculates and returns the dominant frequency from an audio recording.
-def calculate_dominant_frequency(recording, samplerate=44100):
-    # Perform a Fast Fourier Transform (FFT) on the recording.
-    fft_spectrum = np.fft.rfft(recording.flatten())
-    # Calculate the frequencies corresponding to the FFT results.
-    frequencies = np.fft.rfftfreq(len(recording), 1.0 / samplerate)
-    # Identify the frequency with the highest amplitude, which is the dominant frequency.
-    dominant_frequency = frequencies[np.argmax(np.abs(fft_spectrum))]
-    return dominant_frequency
+# Reads the device index from the selected input device entry, e.g. "Microphone [3]" -> 3.
+def update_selected_device(event=None):
+    global selected_device_index
+    selected_device_str = input_device_var.get()
+    selected_device_index = int(selected_device_str.split('[')[-1].rstrip(']'))
+
+
+# Puts a result on the detection queue without blocking the detection thread.
+# If the queue is full, the oldest result is dropped to make room for the new one.
+def publish_detection_result(result):
+    try:
+        detection_results.put_nowait(result)
+    except queue.Full:
+        try:
+            detection_results.get_nowait()
+            pipeline_metrics.increment('dropped_results')
+        except queue.Empty:
+            pass
+        detection_results.put_nowait(result)
 
 
-# Functions for controlling frequency detection
-# -------------------------------------------------------------------
 # Starts the frequency detection process in a separate thread.
 def start_frequency_detection():
-    def detect():
-        global continue_detection
-
-        # Continuously detect frequency while the flag is true.
-        while continue_detection:
-            # Retrieve and set the selected input device.
-            selected_device_str = input_device_var.get()
-            device_index = int(selected_device_str.split('[')[-1].rstrip(']'))
-            sd.default.device = device_index
-
-            # Record audio and calculate its dominant frequency.
-            recording = record_audio(duration=detection_speed)
-            dominant_frequency = calculate_dominant_frequency(recording)
-
-            # Update the GUI with the detected frequency, unless detection has been stopped.
-            if continue_detection:
-                input_sound_label.config(text=f"{dominant_frequency:.2f} Hz")
-                # Compare input frequency with target frequency and update the indicator
-                frequency_difference = abs(target_frequency['frequency'] - dominant_frequency)
-                # Check if the dominant frequency is within [turn_indicator_green] Hz of the target frequency
-
-                if frequency_difference < turn_indicator_green:
-                    tuning_indicator_label.config(text="[  >> | << ]", fg='green')
-                elif frequency_difference > turn_indicator_red:
-                    # If the difference is greater than [turn_indicator_red] Hz, display the indicator in red
-                    if target_frequency['frequency'] > dominant_frequency:
-                        tuning_indicator_label.config(text="[ >> |     ]", fg='red')
-                    else:
-                        tuning_indicator_label.config(text="[     | << ]", fg='red')
-                else:
-                    # For differences between 3 Hz and 50 Hz, display the indicator in black
-                    if target_frequency['frequency'] > dominant_frequency:
-                        tuning_indicator_label.config(text="[  > |     ]", fg='white')
-                    else:
-                        tuning_indicator_label.config(text="[     | <  ]", fg='white')
+    def detect(stop_event):
+        try:
+            run_detection(stop_event)
+        except Exception as error:
+            # E.g. the device can't be opened, or has fewer channels than 'Hexaphonic' mode reads.
+            ui_tasks.put(lambda error=error: detection_failed(stop_event, error))
+        finally:
+            # Release the input device once detection has stopped.
+            capture_engine.close()
+
+    def run_detection(stop_event):
+        # Noise gate, onset detection and window length; see tuner_core.AdaptiveAnalyzer.
+        adaptive = AdaptiveAnalyzer(capture_engine.samplerate, analysis_hop_size, analysis_window_sizes,
+                                    open_level=gate_open_level)
+        # Buffer the analysis windows are copied into and the cached analyzer of 'All strings' mode,
+        # both reused on every cycle. The newest samples of the buffer are analysed.
+        window = np.empty((1, max(adaptive.max_size, all_strings_window_size)), dtype=np.float32)
+        strings_analyzer = get_analyzer(all_strings_window_size, capture_engine.samplerate)
+        # 'Hexaphonic' mode: the same per input channel, with all channels analysed together.
+        hex_tracker = MultiChannelTracker(len(hexaphonic_channels), capture_engine.samplerate, analysis_hop_size,
+                                          analysis_window_sizes, open_level=gate_open_level)
+        hex_channels = max(hexaphonic_channels) + 1
+        hex_window = np.empty((hex_channels, hex_tracker.max_size), dtype=np.float32)
+        hex_strings = np.empty((len(hexaphonic_channels), hex_tracker.max_size), dtype=np.float32)
+        sounding = False
+
+        # Continuously detect frequency until this run is stopped.
+        while not stop_event.is_set():
+            if tuner_mode == 'hex':
+                # Open the selected input device with a channel per string; the stream is only reopened
+                # when the device or the number of channels changes.
+                capture_engine.open(replay_source or selected_device_index, hex_channels)
+                if capture_engine.read_window(hex_window.shape[-1], out=hex_window) is None:
+                    continue
+                started = time.perf_counter()
+                np.take(hex_window, hexaphonic_channels, axis=0, out=hex_strings)
+                frequencies, levels = hex_tracker.process(hex_strings, [capture_engine.next_read] * len(hex_strings),
+                                                          pitch_estimator)
+                # Strings without a reading are shown as not sounding.
+                levels[frequencies <= 0] = -np.inf
+                was_sounding, sounding = sounding, bool(np.isfinite(levels).any())
+                if not sounding:
+                    pipeline_metrics.increment('gated_readings')
+                    if was_sounding:
+                        publish_detection_result((stop_event, 'silence', None, capture_engine.window_time,
+                                                  time.perf_counter()))
+                    continue
+                # The tracker reuses its arrays, so the GUI gets copies.
+                targets = string_targets
+                kind, value = 'strings', (targets, frequencies[:len(targets)].copy(), levels[:len(targets)].copy())
+                finished = time.perf_counter()
+                pipeline_metrics.observe('dsp', finished - started)
+                publish_detection_result((stop_event, kind, value, capture_engine.window_time, finished))
+                continue
+
+            # Open the selected input device; the stream is only reopened when it changes.
+            capture_engine.open(replay_source or selected_device_index, 1)
+
+            # Wait for the next hop of audio and measure its level.
+            if capture_engine.read_window(window.shape[-1], out=window) is None:
+                continue
+            was_sounding, sounding = sounding, adaptive.update(window, capture_engine.next_read)
+            if not sounding:
+                # Silence: skip the pitch analysis, and tell the GUI once that the note has ended.
+                pipeline_metrics.increment('gated_readings')
+                if was_sounding:
+                    publish_detection_result((stop_event, 'silence', None, capture_engine.window_time,
+                                              time.perf_counter()))
+                continue
+
+            if tuner_mode == 'all':
+                # Find the peak of every string in the latest window.
+                targets = string_targets
+                if not targets:
+                    continue
+                started = time.perf_counter()
+                frequencies, levels = strings_analyzer.string_peaks(window[:, -all_strings_window_size:], targets)
+                kind, value = 'strings', (targets, frequencies[0], levels[0])
             else:
-                break  # Exit the loop if detection is stopped.
-
-    global continue_detection
+                # Calculate the dominant frequency of the latest window, as long as the note allows.
+                if not adaptive.ready():
+                    continue
+                started = time.perf_counter()
+                kind, value = 'pitch', adaptive.estimate(window, pitch_estimator)[0]
+                pipeline_metrics.set_gauge('window_size', adaptive.window_size())
+                if value <= 0:
+                    continue
+            finished = time.perf_counter()
+            pipeline_metrics.observe('dsp', finished - started)
+
+            # Hand the result over to the GUI; the Tk thread picks it up in poll_detection_results.
+            publish_detection_result((stop_event, kind, value, capture_engine.window_time, finished))
+
+    global detection_stop_event, detection_thread, capture_engine, replay_source, input_recorder
+    # Ignore the click if detection is already running.
+    if detection_stop_event is not None:
+        return
+    # Wait for the thread of a previous run; it returns quickly because its stream was closed.
+    if detection_thread is not None:
+        detection_thread.join()
     # Change button colors to reflect the current state of detection.
     detect_freq_button.config(bg='green', activebackground='green')  # Start button green
     stop_freq_button.config(bg='SystemButtonFace', activebackground='SystemButtonFace')  # Stop button default
-    continue_detection = True
-    
+    update_selected_device()
+    detection_stop_event = threading.Event()
+
+    # Create the capture engine on first use; it is reused for every later detection run.
+    if capture_engine is None:
+        capture_samplerate = samplerate
+        if replay_file:
+            replay_source = WavSource(replay_file, realtime=replay_realtime, loop=True)
+            capture_samplerate = replay_source.samplerate
+        if record_directory:
+            input_recorder = RingFileRecorder(record_directory, capture_samplerate, record_file_seconds,
+                                              record_max_files)
+        capture_engine = CaptureEngine(samplerate=capture_samplerate, hop_size=analysis_hop_size,
+                                       buffer_seconds=capture_buffer_seconds, metrics=pipeline_metrics,
+                                       recorder=input_recorder)
+
     # Start the detection thread.
-    detection_thread = threading.Thread(target=detect)
+    detection_thread = threading.Thread(target=detect, args=(detection_stop_event,), daemon=True)
     detection_thread.start()
 
 
 # Stops the ongoing frequency detection process.
 def stop_frequency_detection():
-    global continue_detection
-    # Set the flag too False to stop the detection.
-    continue_detection = False
+    global detection_stop_event
+    # Signal the detection thread to stop.
+    if detection_stop_event is not None:
+        detection_stop_event.set()
+        detection_stop_event = None
+    # Close the input stream so a detection thread waiting for audio returns immediately.
+    if capture_engine is not None:
+        capture_engine.close()
     # Reset the displayed frequency and change button colors.
     input_sound_label.config(text="0 Hz")
     detect_freq_button.config(bg='SystemButtonFace', activebackground='SystemButtonFace')  # Start button default
     stop_freq_button.config(bg='red', activebackground='red')  # Stop button red
 
     tuning_indicator_label.config(text="[     |     ]", fg='black')  # Stop showing tuning label
+    for label in string_status_labels:
+        label.config(text="")
+
+
+# Called on the Tk thread when the detection thread of a run ended with an error: resets the run, so Start
+# works again, and shows the error.
+def detection_failed(stop_event, error):
+    # Ignore errors of a run that has been stopped already.
+    if stop_event is not detection_stop_event:
+        return
+    stop_frequency_detection()
+    messagebox.showerror("Detection Error", f"Frequency detection stopped.\n\nDetails:\n{error}")
+
+
+# Drains the detection queue on the Tk thread and shows only the newest result.
+# Runs every [gui_refresh_interval] ms, so redraw cost never slows down the detection thread.
+# Also runs the tasks sent to the Tk thread by the server requests.
+def poll_detection_results():
+    run_ui_tasks()
+    pipeline_metrics.set_gauge('queue_depth', detection_results.qsize())
+    latest = None
+    received = 0
+    while True:
+        try:
+            latest = detection_results.get_nowait()
+            received += 1
+        except queue.Empty:
+            break
+    # Results of a run that has already been stopped are ignored.
+    if latest is not None and latest[0] is detection_stop_event:
+        stop_event, kind, value, window_time, publish_time = latest
+        shown = time.perf_counter()
+        if kind == 'strings':
+            show_string_results(*value)
+        elif kind == 'silence':
+            show_silence()
+        else:
+            show_detection_result(value)
+        # Tk draws the new label texts once this callback returns, within the same event loop pass.
+        done = time.perf_counter()
+        pipeline_metrics.observe('queue', shown - publish_time)
+        pipeline_metrics.observe('ui', done - shown)
+        pipeline_metrics.observe('end_to_end', done - window_time)
+        pipeline_metrics.increment('readings')
+        pipeline_metrics.increment('coalesced_results', received - 1)
+    root.after(gui_refresh_interval, poll_detection_results)
+
+
+# Shows the detected frequency and updates the tuning indicator.
+def show_detection_result(dominant_frequency):
+    # In 'Auto' mode, target the string nearest to the played note.
+    if tuner_mode == 'auto':
+        nearest = find_nearest_string(dominant_frequency)
+        if nearest is not None and nearest != (target_frequency['note'], target_frequency['frequency']):
+            string_button_click(*nearest)
+    # Show the nearest note of the played pitch as well
+    notes, note_cents = note_table.to_note(dominant_frequency)
+    input_sound_label.config(text=f"{dominant_frequency:.2f} Hz ({notes[()]} {float(note_cents):+.0f} cents)")
+    # Compare input frequency with target frequency in cents and update the indicator
+    cents = float(cents_between(dominant_frequency, target_frequency['frequency']))
+    # Without a chosen string every note counts as far too high
+    if np.isnan(cents):
+        cents = np.inf
+    # Check if the dominant frequency is within [turn_indicator_green] cents of the target frequency
+
+    if abs(cents) < turn_indicator_green:
+        tuning_indicator_label.config(text="[  >> | << ]", fg='green')
+    elif abs(cents) > turn_indicator_red:
+        # If the difference is greater than [turn_indicator_red] cents, display the indicator in red
+        if cents < 0:
+            tuning_indicator_label.config(text="[ >> |     ]", fg='red')
+        else:
+            tuning_indicator_label.config(text="[     | << ]", fg='red')
+    else:
+        # For differences between the two thresholds, display the indicator in white
+        if cents < 0:
+            tuning_indicator_label.config(text="[  > |     ]", fg='white')
+        else:
+            tuning_indicator_label.config(text="[     | <  ]", fg='white')
+
+
+# Clears the readings when the played note has faded out.
+def show_silence():
+    input_sound_label.config(text="-- Hz")
+    tuning_indicator_label.config(text="[     |     ]", fg='white')
+    for label in string_status_labels:
+        label.config(text="--", fg='white')
+
+
+# Shows the deviation of every string in 'All strings' mode.
+def show_string_results(targets, frequencies, levels):
+    # Ignore results measured for a tuning that is no longer selected.
+    if targets != string_targets:
+        return
+    # Deviation of every string in cents, in one vectorized step
+    string_cents = cents_between(frequencies, targets)
+    for label, cents, level in zip(string_status_labels, string_cents, levels):
+        if level < string_level_threshold or np.isnan(cents):
+            # The string is not sounding
+            label.config(text="--", fg='white')
+            continue
+        if abs(cents) < turn_indicator_green:
+            color = 'green'
+        elif abs(cents) > turn_indicator_red:
+            color = 'red'
+        else:
+            color = 'white'
+        label.config(text=f"{cents:+.1f} cents", fg=color)
+
+
+# Debug panel
+# -------------------------------------------------------------------
+# Opens the debug panel showing the performance metrics, or closes it when it is already open.
+def toggle_debug_panel():
+    global debug_window, debug_label
+    if debug_window is not None:
+        close_debug_panel()
+        return
+    debug_window = tk.Toplevel(root)
+    debug_window.title("Tuner performance")
+    debug_window.configure(bg='black')
+    debug_window.protocol("WM_DELETE_WINDOW", close_debug_panel)
+    debug_label = tk.Label(debug_window, text="", justify="left", font=("Courier", 9), bg='black', fg='white')
+    debug_label.pack(padx=10, pady=10)
+    buttons_frame = tk.Frame(debug_window, bg='black')
+    buttons_frame.pack(pady=[0, 10])
+    tk.Button(buttons_frame, text="Reset", command=pipeline_metrics.reset).pack(side="left", padx=5)
+    tk.Button(buttons_frame, text="Export", command=export_metrics).pack(side="left", padx=5)
+    update_debug_panel()
+
+
+# Closes the debug panel.
+def close_debug_panel():
+    global debug_window, debug_label
+    if debug_window is not None:
+        debug_window.destroy()
+    debug_window = None
+    debug_label = None
+
+
+# Shows the current metrics in the debug panel while it is open.
+def update_debug_panel():
+    if debug_window is None:
+        return
+    debug_label.config(text=pipeline_metrics.summary())
+    debug_window.after(debug_refresh_interval, update_debug_panel)
+
+
+# Saves the metrics to a JSON file or, with a .prom extension, in the Prometheus text format.
+def export_metrics():
+    file_path = filedialog.asksaveasfilename(parent=debug_window, defaultextension=".json",
+                                             initialfile="tuner_metrics.json",
+                                             filetypes=[("JSON", "*.json"), ("Prometheus", "*.prom")])
+    if file_path:
+        pipeline_metrics.export(file_path)
 
 
 # Function to handle the window closing event
 # -------------------------------------------------------------------
 # Called when the application window is closed.
 def on_closing():
-    global continue_detection, detection_thread
+    global detection_stop_event
     # If detection is ongoing, stop it and wait for the thread to finish.
-    if continue_detection:
-        continue_detection = False
-        if detection_thread is not None:
-            detection_thread.join()
+    if detection_stop_event is not None:
+        detection_stop_event.set()
+        detection_stop_event = None
+    if capture_engine is not None:
+        capture_engine.close()
+    if detection_thread is not None:
+        detection_thread.join()
+    if input_recorder is not None:
+        input_recorder.close()
+    # Drop server requests that have not started yet; a running one ends with its timeout.
+    server_executor.shutdown(wait=False, cancel_futures=True)
+    unsubscribe_tuning_events()
     # Close the application window.
     root.destroy()
 
@@ -299,135 +1001,160 @@ def on_closing():
 # *          MAIN           *
 # ***************************
 # -------------------------------------------------------------------
-# Initialize and get the list of input devices.
-get_input_devices()
-
-# GUI Section
-# -------------------------------------------------------------------
-# Create the main application window
-root = tk.Tk()
-root.title("Guitar Tuner")                  # Set the title of the window
-root.geometry('540x605')                    # Set the fixed size of the window
-root.configure(bg='black')                  # Set the background color of the root window
-root.resizable(False, False)    # Disable resizing of the window
-# Bind the closing protocol to the on_closing function
-root.protocol("WM_DELETE_WINDOW", on_closing)
-# Configure the grid layout of the root window
-root.grid_columnconfigure(1, weight=1)
-root.grid_columnconfigure(2, weight=1)
-
-
-# ----- CUSTOM FONT FOR ALL LABELS -----
-custom_font = font.Font(family="Arial", size=10, weight="bold")
-
-
-# ----- BG IMAGE -----
-# Load the background image
-bg_image = Image.open('static/bg2.jpg')
-# Resize the image to 30% of its original size
-width, height = bg_image.size
-new_width = int(width * 0.15)
-new_height = int(height * 0.15)
-bg_image = bg_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-bg_photo = ImageTk.PhotoImage(bg_image)
-# Create a frame for the image and place it in the fourth column
-image_frame = tk.Frame(root, highlightbackground='black', highlightthickness=0)
-image_frame.grid(row=0, column=3, rowspan=15, sticky='ns')
-# Place the image inside the frame
-bg_label = tk.Label(image_frame, image=bg_photo, borderwidth=0)
-bg_label.pack(expand=True, fill='both', padx=0, pady=0)
-
-
-# ----- TARGET NOTE TO HIT -----
-# Create and place label for displaying the targeted note
-tk.Label(root, text="Target note:", bg='black', fg='#05e1fa', font=custom_font).grid(row=10, column=0, sticky="w", padx=10)
-target_note_label = tk.Label(root, text=f"{target_frequency['note']} - {target_frequency['frequency']:.2f} Hz",
-                             bg='black', fg='white', font=custom_font)
-target_note_label.grid(row=10, column=1, sticky="w")
-
-
-# ----- TUNING SELECTION -----
-# Initialize tunings_list_source variable
-tunings_list_source = tk.StringVar(value="Local")  # Default to 'Local'
-# Radio Buttons for Tuning Source
-tk.Label(root, text="Get tuning from:", bg='black', fg='#05e1fa', font=custom_font).grid(row=0, column=0,
-                                                                                         sticky="w", padx=10)
-# Radio Buttons for Tuning Source
-tk.Radiobutton(root, text="Local App", variable=tunings_list_source, value="Local",
-               command=update_tunings, bg='black', fg='white', selectcolor='black').grid(row=0, column=1, sticky="w")
-tk.Radiobutton(root, text="Local Server", variable=tunings_list_source, value="Local Server",
-               command=update_tunings, bg='black', fg='white', selectcolor='black').grid(row=0, column=2, sticky="w")
-tk.Radiobutton(root, text="Render Server", variable=tunings_list_source, value="Render Server",
-               command=update_tunings, bg='black', fg='white', selectcolor='black').grid(row=0, column=3, sticky="w")
-
-
-# Tuning Selection Combobox
-# Set Local tunings as default
-tunings = local_tunings
-tk.Label(root, text="Tuning:", bg='black', fg='#05e1fa', font=custom_font).grid(row=1, column=0, sticky="w", padx=10)
-tuning_var = tk.StringVar(root)
-tuning_combobox = ttk.Combobox(root, textvariable=tuning_var, state="readonly")
-tuning_combobox.grid(row=1, column=1, columnspan=2, sticky="ew", padx=[0, 15], pady=5)
-tuning_combobox.bind('<<ComboboxSelected>>', lambda event: update_string_buttons(tuning_var.get()))
-update_combobox()
-
-
-# ----- INPUT SELECTION -----
-# Create and place the input device selection label and combobox
-tk.Label(root, text="Input device:", bg='black', fg='#05e1fa', font=custom_font).grid(row=2, column=0, sticky="w", padx=10)
-input_device_var = tk.StringVar(root)
-input_device_combobox = ttk.Combobox(root, textvariable=input_device_var, values=input_devices, state="readonly")
-input_device_combobox.grid(row=2, column=1, columnspan=2, sticky="ew", padx=[0,15], pady=5)
-input_device_combobox.current(0)  # Initialize with the first input device option selected
-
-
-# ----- GUITAR STRING BUTTONS -----
-# Create and place buttons for each string based on the selected tuning
-tk.Label(root, text="Choose string:", bg='black', fg='#05e1fa', font=custom_font).grid(row=3, column=0, sticky="w", padx=10)
-string_buttons = []
-# Since tunings is a list of dictionaries, we extract the first tuning's notes by default.
-# You may want to do this after a tuning is selected from the combobox instead.
-selected_tuning_dict = tunings[tuning_combobox.current()]  # get the current selected tuning
-selected_tuning_name = tuning_var.get()  # get the name of the tuning
-notes_list = selected_tuning_dict[selected_tuning_name]  # get the list of notes for this tuning
-# Create buttons for each note in the selected tuning
-for i, note_dict in enumerate(notes_list):
-    for note, freq in note_dict.items():
-        button_text = f"{note} - {freq:.2f} Hz"
-        btn = tk.Button(root, text=button_text, padx=5, pady=5,
-                        command=lambda note=note, freq=freq: string_button_click(note, freq))
-        btn.grid(row=4 + i, column=1, sticky="ew", padx=[0, 5])
-        string_buttons.append(btn)
-
-
-# ----- DOMINANT INPUT FREQUENCY -----
-# Create and place label for displaying the detected input sound frequency
-tk.Label(root, text="Input sound:", bg='black', fg='#05e1fa', font=custom_font).grid(row=11, column=0, sticky="w", padx=10)
-input_sound_label = tk.Label(root, text=f"{input_frequency} Hz", bg='black', fg='white', font=custom_font)
-input_sound_label.grid(row=11, column=1, sticky="w")
-
-
-# ----- TUNING INDICATOR -----
-# Tuning Indicator Label
-tuning_indicator_label = tk.Label(root, text="[     |     ]", font=("Courier", 12, "bold"), bg='black', fg='white')
-tuning_indicator_label.grid(row=12, column=1, sticky="ew")
-
-
-# ----- START / STOP TUNING -----
-# Create and place labels and buttons for starting and stopping frequency detection
-detect_freq_label = tk.Label(root, text=f"Start tuning:", padx=10, bg='black', fg='#05e1fa', font=custom_font)
-detect_freq_label.grid(row=13, column=0, sticky="w")
-detect_freq_button = tk.Button(root, text="Start", command=start_frequency_detection, width=40)  # Button to start detection
-detect_freq_button.grid(row=13, column=1, padx=10, pady=5, sticky="ew")
-stop_freq_button = tk.Button(root, text="Stop", command=stop_frequency_detection, width=40)  # Button to stop detection
-stop_freq_button.grid(row=13, column=2, padx=10, pady=5, sticky="ew")
-
-
-# ----- SIGNITURE -----
-# Create and place a signature label
-signiture_label = tk.Label(root, text=f"by Kojc", bg='black', fg='#05e1fa', font=custom_font)
-signiture_label.grid(row=14, column=3, sticky="e", padx=[0,15])
-
-
-# Start the Tkinter main event loop
-root.mainloop()
+if __name__ == '__main__':
+    # Initialize and get the list of input devices.
+    get_input_devices()
+
+    # GUI Section
+    # -------------------------------------------------------------------
+    # Create the main application window
+    root = tk.Tk()
+    root.title("Guitar Tuner")                  # Set the title of the window
+    root.geometry('540x605')                    # Set the fixed size of the window
+    root.configure(bg='black')                  # Set the background color of the root window
+    root.resizable(False, False)    # Disable resizing of the window
+    # Bind the closing protocol to the on_closing function
+    root.protocol("WM_DELETE_WINDOW", on_closing)
+    # Configure the grid layout of the root window
+    root.grid_columnconfigure(1, weight=1)
+    root.grid_columnconfigure(2, weight=1)
+
+
+    # ----- CUSTOM FONT FOR ALL LABELS -----
+    custom_font = font.Font(family="Arial", size=10, weight="bold")
+
+
+    # ----- BG IMAGE -----
+    # Pillow is only needed to draw the GUI, so it is imported here rather than at the top of the file.
+    from PIL import Image, ImageTk
+    # Load the background image
+    bg_image = Image.open('static/bg2.jpg')
+    # Resize the image to 30% of its original size
+    width, height = bg_image.size
+    new_width = int(width * 0.15)
+    new_height = int(height * 0.15)
+    bg_image = bg_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    bg_photo = ImageTk.PhotoImage(bg_image)
+    # Create a frame for the image and place it in the fourth column
+    image_frame = tk.Frame(root, highlightbackground='black', highlightthickness=0)
+    image_frame.grid(row=0, column=3, rowspan=15, sticky='ns')
+    # Place the image inside the frame
+    bg_label = tk.Label(image_frame, image=bg_photo, borderwidth=0)
+    bg_label.pack(expand=True, fill='both', padx=0, pady=0)
+
+
+    # ----- TARGET NOTE TO HIT -----
+    # Create and place label for displaying the targeted note
+    tk.Label(root, text="Target note:", bg='black', fg='#05e1fa', font=custom_font).grid(row=10, column=0, sticky="w", padx=10)
+    target_note_label = tk.Label(root, text=f"{target_frequency['note']} - {target_frequency['frequency']:.2f} Hz",
+                                 bg='black', fg='white', font=custom_font)
+    target_note_label.grid(row=10, column=1, sticky="w")
+
+
+    # ----- TUNING SELECTION -----
+    # Initialize tunings_list_source variable
+    tunings_list_source = tk.StringVar(value="Local")  # Default to 'Local'
+    # Radio Buttons for Tuning Source
+    tk.Label(root, text="Get tuning from:", bg='black', fg='#05e1fa', font=custom_font).grid(row=0, column=0,
+                                                                                             sticky="w", padx=10)
+    # Radio Buttons for Tuning Source
+    tk.Radiobutton(root, text="Local App", variable=tunings_list_source, value="Local",
+                   command=update_tunings, bg='black', fg='white', selectcolor='black').grid(row=0, column=1, sticky="w")
+    tk.Radiobutton(root, text="Local Server", variable=tunings_list_source, value="Local Server",
+                   command=update_tunings, bg='black', fg='white', selectcolor='black').grid(row=0, column=2, sticky="w")
+    tk.Radiobutton(root, text="Render Server", variable=tunings_list_source, value="Render Server",
+                   command=update_tunings, bg='black', fg='white', selectcolor='black').grid(row=0, column=3, sticky="w")
+
+
+    # Tuning Selection Combobox
+    # Set Local tunings as default
+    tunings = local_tunings
+    # Tunings source selected when the app was last used; server tunings are shown from the offline cache
+    tunings_list_source.set(load_server_cache())
+    tk.Label(root, text="Tuning:", bg='black', fg='#05e1fa', font=custom_font).grid(row=1, column=0, sticky="w", padx=10)
+    tuning_var = tk.StringVar(root)
+    tuning_combobox = ttk.Combobox(root, textvariable=tuning_var, state="readonly")
+    tuning_combobox.grid(row=1, column=1, columnspan=2, sticky="ew", padx=[0, 15], pady=5)
+    tuning_combobox.bind('<<ComboboxSelected>>', lambda event: update_string_buttons(tuning_var.get()))
+    # Pitch of A4 the strings are tuned to
+    a4_frame = tk.Frame(root, bg='black')
+    a4_frame.grid(row=1, column=3, sticky="w")
+    tk.Label(a4_frame, text="A4:", bg='black', fg='#05e1fa', font=custom_font).pack(side="left")
+    a4_var = tk.StringVar(root, value=f"{a4_frequency:g}")
+    a4_spinbox = tk.Spinbox(a4_frame, from_=a4_min, to=a4_max, increment=1, textvariable=a4_var, width=5,
+                            command=update_a4)
+    a4_spinbox.pack(side="left")
+    a4_spinbox.bind('<Return>', update_a4)
+    a4_spinbox.bind('<FocusOut>', update_a4)
+    tk.Label(a4_frame, text="Hz", bg='black', fg='white', font=custom_font).pack(side="left")
+    update_tunings()
+
+
+    # ----- INPUT SELECTION -----
+    # Create and place the input device selection label and combobox
+    tk.Label(root, text="Input device:", bg='black', fg='#05e1fa', font=custom_font).grid(row=2, column=0, sticky="w", padx=10)
+    input_device_var = tk.StringVar(root)
+    input_device_combobox = ttk.Combobox(root, textvariable=input_device_var, values=input_devices, state="readonly")
+    input_device_combobox.grid(row=2, column=1, columnspan=2, sticky="ew", padx=[0,15], pady=5)
+    input_device_combobox.current(0)  # Initialize with the first input device option selected
+    # Keep the device index for the detection thread up to date
+    input_device_combobox.bind('<<ComboboxSelected>>', update_selected_device)
+
+
+    # ----- GUITAR STRING BUTTONS -----
+    # Create and place buttons for each string based on the selected tuning
+    tk.Label(root, text="Choose string:", bg='black', fg='#05e1fa', font=custom_font).grid(row=3, column=0, sticky="w", padx=10)
+    # The buttons for the first tuning were already created by update_combobox() above.
+    # Radio buttons for the tuner mode: tune one chosen string, let the tuner choose the string,
+    # or tune all strings of the tuning at once
+    tuner_mode_var = tk.StringVar(value=tuner_mode)
+    tuner_mode_frame = tk.Frame(root, bg='black')
+    tuner_mode_frame.grid(row=3, column=1, columnspan=2, sticky="w")
+    tk.Radiobutton(tuner_mode_frame, text="Single string", variable=tuner_mode_var, value="single",
+                   command=update_tuner_mode, bg='black', fg='white', selectcolor='black').pack(side="left")
+    tk.Radiobutton(tuner_mode_frame, text="Auto", variable=tuner_mode_var, value="auto",
+                   command=update_tuner_mode, bg='black', fg='white', selectcolor='black').pack(side="left")
+    tk.Radiobutton(tuner_mode_frame, text="All strings", variable=tuner_mode_var, value="all",
+                   command=update_tuner_mode, bg='black', fg='white', selectcolor='black').pack(side="left")
+    tk.Radiobutton(tuner_mode_frame, text="Hexaphonic", variable=tuner_mode_var, value="hex",
+                   command=update_tuner_mode, bg='black', fg='white', selectcolor='black').pack(side="left")
+
+
+    # ----- DOMINANT INPUT FREQUENCY -----
+    # Create and place label for displaying the detected input sound frequency
+    tk.Label(root, text="Input sound:", bg='black', fg='#05e1fa', font=custom_font).grid(row=11, column=0, sticky="w", padx=10)
+    input_sound_label = tk.Label(root, text=f"{input_frequency} Hz", bg='black', fg='white', font=custom_font)
+    input_sound_label.grid(row=11, column=1, sticky="w")
+
+
+    # ----- TUNING INDICATOR -----
+    # Tuning Indicator Label
+    tuning_indicator_label = tk.Label(root, text="[     |     ]", font=("Courier", 12, "bold"), bg='black', fg='white')
+    tuning_indicator_label.grid(row=12, column=1, sticky="ew")
+
+
+    # ----- START / STOP TUNING -----
+    # Create and place labels and buttons for starting and stopping frequency detection
+    detect_freq_label = tk.Label(root, text=f"Start tuning:", padx=10, bg='black', fg='#05e1fa', font=custom_font)
+    detect_freq_label.grid(row=13, column=0, sticky="w")
+    detect_freq_button = tk.Button(root, text="Start", command=start_frequency_detection, width=40)  # Button to start detection
+    detect_freq_button.grid(row=13, column=1, padx=10, pady=5, sticky="ew")
+    stop_freq_button = tk.Button(root, text="Stop", command=stop_frequency_detection, width=40)  # Button to stop detection
+    stop_freq_button.grid(row=13, column=2, padx=10, pady=5, sticky="ew")
+
+
+    # ----- SIGNITURE -----
+    # Create and place a signature label
+    signiture_label = tk.Label(root, text=f"by Kojc", bg='black', fg='#05e1fa', font=custom_font)
+    signiture_label.grid(row=14, column=3, sticky="e", padx=[0,15])
+
+
+    # ----- DEBUG PANEL -----
+    # Button that opens the performance metrics panel
+    debug_button = tk.Button(root, text="Debug", command=toggle_debug_panel)
+    debug_button.grid(row=14, column=0, sticky="w", padx=10)
+
+
+    # Start showing detection results and the Tkinter main event loop
+    root.after(gui_refresh_interval, poll_detection_results)
+    root.mainloop()
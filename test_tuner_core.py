@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import benchmark
+import tuner_core
+
+
+# Open strings of the standard tuning (Hz)
+open_strings = [82.41, 110.0, 146.83, 196.0, 246.94, 329.63]
+
+
+# Pitch estimators
+# -------------------------------------------------------------------
+# Pure sines have no harmonics to line up, so every estimator has to find the fundamental itself.
+@pytest.mark.parametrize('method', sorted(tuner_core.pitch_estimators))
+@pytest.mark.parametrize('size', [4096, 16384])
+def test_pure_tones(method, size):
+    samplerate = 44100
+    time = np.arange(size) / samplerate
+    frames = np.array([0.5 * np.sin(2 * np.pi * frequency * time) for frequency in open_strings])
+    estimates = tuner_core.PitchAnalyzer(size, samplerate).estimate(frames, method)
+    assert np.abs(1200 * np.log2(estimates / open_strings)).max() < 5
+
+
+# An empty batch (e.g. a clip shorter than one frame after gating) gives an empty result.
+@pytest.mark.parametrize('method', sorted(tuner_core.pitch_estimators))
+def test_empty_batch(method):
+    assert tuner_core.PitchAnalyzer(4096, 44100).estimate(np.empty((0, 4096)), method).shape == (0,)
+
+
+# Frames split by the caller are timed with the hop the caller used, which analyze_batch can't guess.
+def test_batch_frame_times():
+    signal = np.sin(2 * np.pi * 110 * np.arange(44100) / 44100)
+    frames = tuner_core.frame_signal(signal, 4096, 1024)
+    with pytest.raises(ValueError):
+        tuner_core.analyze_batch(frames)
+    assert np.allclose(tuner_core.analyze_batch(frames, hop_size=1024)['time'],
+                       tuner_core.analyze_batch(signal, hop_size=1024)['time'])
+    assert tuner_core.analyze_batch(signal)['time'][1] == 2048 / 44100
+
+
+# Strings of a strummed chord share partials (e.g. the 3rd harmonic of E2 and B3), yet every string has to be
+# measured to within the 5 cents at which the tuner shows it as in tune.
+@pytest.mark.parametrize('seed', range(10))
+def test_string_peaks_strum(seed):
+    samplerate, size = 44100, 16384
+    rng = np.random.default_rng(seed)
+    strum = np.zeros(2 * samplerate)
+    true_frequencies = []
+    for frequency in open_strings:
+        pluck, true_frequency = benchmark.karplus_strong(frequency * 2 ** (rng.uniform(-30, 30) / 1200), samplerate,
+                                                         2.0, rng)
+        strum += pluck[:len(strum)] / len(open_strings)
+        true_frequencies.append(true_frequency)
+    frames = tuner_core.frame_signal(strum[2048:], size, 4096)[:3]
+    frequencies, levels = tuner_core.PitchAnalyzer(size, samplerate).string_peaks(frames, open_strings)
+    assert np.abs(1200 * np.log2(frequencies / true_frequencies)).max() < 5
+
+
+# Adaptive analysis
+# -------------------------------------------------------------------
+# Feeds 'signal' to an AdaptiveAnalyzer hop by hop and returns whether a note was sounding at every hop.
+def gate_states(signal, samplerate=44100, hop_size=512):
+    adaptive = tuner_core.AdaptiveAnalyzer(samplerate, hop_size)
+    return np.array([adaptive.update(signal[end - adaptive.max_size:end], end)
+                     for end in range(adaptive.max_size, len(signal), hop_size)])
+
+
+# Steady background noise louder than the gate must not keep it open (and produce pitches) for good.
+@pytest.mark.parametrize('level', [-45, -40])
+def test_gate_closes_on_constant_noise(level):
+    samplerate = 44100
+    noise = np.random.default_rng(0).standard_normal(20 * samplerate) * 10 ** (level / 20)
+    sounding = gate_states(noise, samplerate)
+    assert not sounding[len(sounding) // 2:].any()
+
+
+# A decaying note over quiet noise keeps the gate open for its first seconds.
+def test_gate_follows_note():
+    samplerate = 44100
+    time = np.arange(8 * samplerate) / samplerate
+    note = 0.3 * np.exp(-time / 3) * np.sin(2 * np.pi * 82.41 * time)
+    signal = np.concatenate([np.zeros(samplerate), note]) + \
+        np.random.default_rng(0).standard_normal(9 * samplerate) * 1e-4
+    sounding = gate_states(signal, samplerate)
+    hop_seconds = 512 / samplerate
+    assert not sounding[:int(0.5 / hop_seconds)].any()
+    assert sounding[int(1.5 / hop_seconds):int(5 / hop_seconds)].all()
@@ -0,0 +1,1514 @@
+import argparse
+import json
+import sys
+import threading
+import os
+import queue
+import time
+import wave
+from bisect import bisect_left
+from functools import partial
+import numpy as np
+
+
+# ***************************
+# *    Global variables     *
+# ***************************
+# Pitch detection settings
+# -------------------------------------------------------------------
+# Method used to estimate the pitch of each window - one of the keys of 'pitch_estimators':
+# 'fft' = strongest spectral peak, 'hps' = harmonic product spectrum, 'yin' = YIN autocorrelation
+pitch_estimator = 'yin'
+min_detect_frequency = 60     # Hz - Lowest pitch the estimators look for
+max_detect_frequency = 1000   # Hz - Highest pitch the estimators look for
+# The 'fft' and 'hps' peaks are moved down to the lowest subharmonic (peak / 2 ... peak / this) that is a
+# spectral peak at least 'subharmonic_level' times as strong as the loudest bin - plucked strings often have
+# a weaker fundamental than their 2nd - 10th harmonics.
+max_subharmonic = 16
+subharmonic_level = 0.1
+
+# Adaptive analysis of live audio (see AdaptiveAnalyzer)
+window_ladder = (2048, 4096, 8192, 16384)  # samples - Window lengths used as a note sustains, shortest first
+gate_open_level = -50    # dBFS - A note starts sounding when the level of the newest hop rises above this...
+noise_margin = 12        # dB - ...and at least this much above the measured noise floor
+gate_hysteresis = 6      # dB - It stops sounding when the level falls this much below the opening level...
+gate_release = 30        # dB - ...or this much below the loudest level of the note, before it fades into the noise
+onset_jump = 9           # dB - A rise of the level by this much from one reading to the next is a new pluck
+noise_rise = 3           # dB/s - While a note sounds the noise floor still rises this fast towards the level, so
+                         #        steady noise louder than the gate closes it again (a string decays faster)
+
+# Frames analysed together in one vectorized pass (see PitchAnalyzer.estimate).
+# Bigger batches are faster but need more memory: the work buffers take about 280 kB per frame of 4096 samples
+# for 'yin' and 200 kB for 'hps' (4x that for 16384 samples), so a batch is also cut to 'max_batch_bytes'.
+batch_size = 256
+max_batch_bytes = 32 * 2 ** 20   # bytes - Work buffers of one analyzer at most
+
+# Note names used when reporting the nearest note, indexed by MIDI note number % 12.
+note_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Name of every MIDI note (0 - 127), e.g. midi_note_names[40] == 'E2'.
+midi_note_names = np.array([f"{note_names[midi % 12]}{midi // 12 - 1}" for midi in range(128)])
+
+# MIDI note number of every spelling of a note name with sharps or flats, casefolded for the lookup,
+# e.g. note_midi['e2'] == note_midi['fb2'] == 40 and note_midi['eb2'] == note_midi['d#2'] == 39.
+note_letters = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+note_midi = {f"{letter}{accidental}{octave}".casefold(): (octave + 1) * 12 + semitone + shift
+             for letter, semitone in note_letters.items()
+             for accidental, shift in (('', 0), ('#', 1), ('b', -1))
+             for octave in range(-1, 10)
+             if 0 <= (octave + 1) * 12 + semitone + shift < 128}
+
+# Reference pitch (see NoteTable)
+a4_reference = 440.0    # Hz - Pitch of A4 the stored tunings are written for
+a4_min = 432.0          # Hz - Lowest and highest A4 calibration accepted
+a4_max = 446.0
+note_tolerance = 50     # cents - A stored frequency has to be within this much of its note (A4 = 440 Hz)
+
+
+# ***************************
+# *        Functions        *
+# ***************************
+# Pitch estimators
+# -------------------------------------------------------------------
+# Refines peak positions with a parabola fitted through each peak and its two neighbours.
+# 'values' holds one row per frame and 'index' the integer peak position in each row;
+# returns the fractional peak positions.
+def parabolic_interpolation(values, index):
+    rows = np.arange(values.shape[0])
+    index = np.clip(index, 1, values.shape[1] - 2)
+    left, centre, right = values[rows, index - 1], values[rows, index], values[rows, index + 1]
+    curvature = left - 2 * centre + right
+    offset = np.divide(left - right, 2 * curvature, out=np.zeros_like(centre), where=curvature != 0)
+    return index + np.clip(offset, -1, 1)
+
+
+# Runs a real FFT into a preallocated output array where NumPy supports it (NumPy 2.0 and newer, as in
+# requirements.txt). Older versions still work, but allocate a new spectrum for every call.
+if np.lib.NumpyVersion(np.__version__) >= '2.0.0':
+    def _rfft(frames, n, out):
+        return np.fft.rfft(frames, n=n, axis=-1, out=out)
+
+    def _irfft(spectrum, n, out):
+        return np.fft.irfft(spectrum, n=n, axis=-1, out=out)
+else:
+    def _rfft(frames, n, out):
+        out[...] = np.fft.rfft(frames, n=n, axis=-1)
+        return out
+
+    def _irfft(spectrum, n, out):
+        out[...] = np.fft.irfft(spectrum, n=n, axis=-1)
+        return out
+
+
+# Pitch analyzer for one window length and samplerate.
+# Everything that only depends on those two values - the Hann window, the frequency axis, the MIDI note
+# of every FFT bin, the search ranges and the work buffers - is prepared once, so analysing a window in
+# the detection loop does not rebuild the setup or allocate new spectrum arrays.
+# Use get_analyzer() to get a cached instance instead of creating analyzers directly.
+class PitchAnalyzer:
+    def __init__(self, size, samplerate, zero_padding=2):
+        self.size = size
+        self.samplerate = samplerate
+
+        # Spectrum based estimators (FFT, HPS)
+        self.n_fft = size * zero_padding
+        self.window = np.hanning(size)
+        self.frequencies = np.fft.rfftfreq(self.n_fft, 1.0 / samplerate)
+        # Fractional MIDI note number at the centre of every FFT bin (bin 0 is treated as 1 Hz).
+        self.bin_midi = 69 + 12 * np.log2(np.maximum(self.frequencies, 1.0) / 440.0)
+        self.low_bin = int(min_detect_frequency * self.n_fft / samplerate)
+        self.high_bin = int(max_detect_frequency * self.n_fft / samplerate) + 1
+
+        # YIN: lags between the shortest and the longest period searched for
+        self.width = size // 2
+        self.tau_max = min(int(samplerate / min_detect_frequency) + 2, self.width)
+        self.tau_min = max(int(samplerate / max_detect_frequency), 2)
+        self.n_yin = 1 << (size + self.width - 1).bit_length()
+        self.taus = np.arange(1, self.tau_max, dtype=np.float64)
+        self.lag_index = np.arange(self.tau_max - self.tau_min)
+
+        # Search bands and overlapping harmonics of the string peak finder, cached per tuple of target frequencies.
+        self._bands = {}
+        self._overlaps = {}
+        # Bins and candidate kernels of _fit_string, cached per band.
+        self._fit_kernels = {}
+
+        # Work buffers, in groups that are only allocated once an estimator needs them:
+        # group -> [(attribute, columns, data type, initial value or None)]
+        bins = self.n_fft // 2 + 1
+        lags = self.tau_max - self.tau_min
+        self._layout = {'frames': [('_windowed', self.size, np.float64, None)],
+                        'spectrum': [('_spectrum', bins, np.complex128, None),
+                                     ('_magnitude', bins, np.float64, None),
+                                     ('_log_spectrum', bins, np.float64, None)],
+                        'hps': [('_product', bins, np.float64, None)],
+                        'yin': [('_head_spectrum', self.n_yin // 2 + 1, np.complex128, None),
+                                ('_full_spectrum', self.n_yin // 2 + 1, np.complex128, None),
+                                ('_correlation', self.n_yin, np.float64, None),
+                                ('_energy', self.size + 1, np.float64, 0),
+                                ('_difference', self.tau_max, np.float64, None),
+                                ('_running', self.tau_max - 1, np.float64, None),
+                                ('_normalized', self.tau_max, np.float64, 1),
+                                ('_below', lags, np.bool_, None),
+                                ('_dip', lags, np.bool_, None)]}
+        # Rows allocated in every group so far
+        self._capacity = {}
+
+    # (Re)allocates the work buffers of the given groups for at least 'rows' frames at once.
+    def _allocate(self, rows, *groups):
+        for group in groups:
+            if self._capacity.get(group, -1) >= rows:
+                continue
+            self._capacity[group] = rows
+            for name, columns, dtype, fill in self._layout[group]:
+                setattr(self, name, np.empty((rows, columns), dtype=dtype) if fill is None
+                        else np.full((rows, columns), fill, dtype=dtype))
+
+    # Returns 'buffer' limited to the first 'rows' frames.
+    @staticmethod
+    def _rows(buffer, rows):
+        return buffer if len(buffer) == rows else buffer[:rows]
+
+    # Returns how many frames 'method' analyses in one pass: at most 'batch_size', and no more than fit
+    # the work buffers of the method into 'max_batch_bytes'.
+    def batch_rows(self, method=None):
+        groups = estimator_buffers.get(method or pitch_estimator, tuple(self._layout))
+        row_bytes = sum(columns * np.dtype(dtype).itemsize
+                        for group in groups for _, columns, dtype, _ in self._layout[group])
+        return max(1, min(batch_size, max_batch_bytes // row_bytes))
+
+    # Estimates the pitch of every row of 'frames' with the given method (defaults to 'pitch_estimator').
+    # Larger inputs are analysed in passes of batch_rows() frames.
+    def estimate(self, frames, method=None):
+        estimator = pitch_estimators[method or pitch_estimator]
+        rows = self.batch_rows(method)
+        if len(frames) <= rows:
+            return estimator(self, frames)
+        frequencies = np.empty(len(frames))
+        for start in range(0, len(frames), rows):
+            frequencies[start:start + rows] = estimator(self, frames[start:start + rows])
+        return frequencies
+
+    # Computes the magnitude and the log magnitude spectrum of the Hann windowed frames.
+    # The log spectrum has a floor relative to the loudest bin, which stops empty bins from dominating.
+    def _spectra(self, frames):
+        rows = len(frames)
+        self._allocate(rows, 'frames', 'spectrum')
+        windowed = self._rows(self._windowed, rows)
+        magnitude = self._rows(self._magnitude, rows)
+        log_spectrum = self._rows(self._log_spectrum, rows)
+        np.multiply(frames, self.window, out=windowed)
+        np.abs(_rfft(windowed, self.n_fft, self._rows(self._spectrum, rows)), out=magnitude)
+        np.add(magnitude, 1e-3 * magnitude.max(axis=-1, keepdims=True) + 1e-12, out=log_spectrum)
+        np.log(log_spectrum, out=log_spectrum)
+        return magnitude, log_spectrum
+
+    # Returns whether the bins 'index' (a column of bin numbers per frame, or a slice of bins) are spectral
+    # peaks: louder than the bin below, at least as loud as the bin above and at least 'subharmonic_level' times
+    # 'loudest' (the loudest bin of every frame in the pitch range, as a column). Bins on the slope of a peak,
+    # e.g. in the main lobe of a neighbouring harmonic, are not.
+    def _is_peak(self, magnitude, index, loudest):
+        if isinstance(index, slice):
+            below, centre, above = (magnitude[:, index.start + shift:index.stop + shift] for shift in (-1, 0, 1))
+        else:
+            rows = np.arange(len(magnitude))[:, np.newaxis]
+            below, centre, above = (magnitude[rows, index + shift] for shift in (-1, 0, 1))
+        return (centre > below) & (centre >= above) & (centre >= subharmonic_level * loudest)
+
+    # Moves the peak bin of every frame down to the lowest subharmonic peak / d (d = 2 ... max_subharmonic)
+    # that is a spectral peak itself (see _is_peak). This corrects peaks found on a harmonic when the
+    # fundamental is weak but present; a fundamental quieter than that (or missing) still gives the harmonic.
+    def _fundamental_bin(self, magnitude, peak):
+        rows = np.arange(len(peak))
+        loudest = magnitude[:, self.low_bin:self.high_bin].max(axis=-1, keepdims=True)
+        found = np.zeros(len(peak), dtype=bool)
+        fundamental = peak.copy()
+        for divisor in range(max_subharmonic, 1, -1):
+            # Look for the subharmonic in its nearest bin and both neighbours.
+            centre = np.clip(np.rint(peak / divisor).astype(np.intp), 2, magnitude.shape[-1] - 3)
+            candidates = centre[:, np.newaxis] + np.arange(-1, 2)
+            candidate = candidates[rows, np.argmax(magnitude[rows[:, np.newaxis], candidates], axis=-1)]
+            strong = self._is_peak(magnitude, candidate[:, np.newaxis], loudest)[:, 0]
+            strong &= ~found & (peak / divisor >= self.low_bin)
+            fundamental[strong] = candidate[strong]
+            found |= strong
+        return fundamental
+
+    # Windowed FFT estimator: the strongest peak, interpolated on the log magnitude spectrum and corrected
+    # to its lowest strong subharmonic (see _fundamental_bin).
+    def estimate_fft(self, frames):
+        magnitude, log_spectrum = self._spectra(frames)
+        peak = self.low_bin + np.argmax(magnitude[:, self.low_bin:self.high_bin], axis=-1)
+        peak = self._fundamental_bin(magnitude, peak)
+        return parabolic_interpolation(log_spectrum, peak) * self.samplerate / self.n_fft
+
+    # Harmonic product spectrum estimator: adds the log spectrum to copies of itself compressed by
+    # 2, 3, ... so that only the fundamental, which lines up with all its harmonics, stays strong.
+    # On plucked strings the upper harmonics dominate the product too, so the peak is corrected to its
+    # lowest strong subharmonic like the FFT peak. With short windows (2048 samples) the low strings are only
+    # a few bins wide, and both are off by up to 10 - 20 cents (95th percentile); 'yin' stays more accurate.
+    def estimate_hps(self, frames, harmonics=5):
+        magnitude, log_spectrum = self._spectra(frames)
+        self._allocate(len(frames), 'hps')
+        length = log_spectrum.shape[-1] // harmonics
+        product = self._rows(self._product, len(frames))[:, :length]
+        np.copyto(product, log_spectrum[:, :length])
+        for harmonic in range(2, harmonics + 1):
+            np.add(product, log_spectrum[:, ::harmonic][:, :length], out=product)
+        high = min(self.high_bin, length)
+        # Only spectral peaks are candidates: with the floor of the log spectrum, bins between the harmonics
+        # (e.g. below the fundamental of a pure tone) can add up to as much as the fundamental.
+        loudest = magnitude[:, self.low_bin:self.high_bin].max(axis=-1, keepdims=True)
+        candidates = np.where(self._is_peak(magnitude, slice(self.low_bin, high), loudest),
+                              product[:, self.low_bin:high], -np.inf)
+        peak = self.low_bin + np.argmax(candidates, axis=-1)
+        peak = self._fundamental_bin(magnitude, peak)
+        return parabolic_interpolation(log_spectrum, peak) * self.samplerate / self.n_fft
+
+    # YIN estimator: finds the first strong dip of the cumulative mean normalised difference function,
+    # i.e. the shortest lag at which the signal repeats itself. Returns 0 Hz for silent frames.
+    def estimate_yin(self, frames, threshold=0.15):
+        rows = len(frames)
+        self._allocate(rows, 'frames', 'yin')
+        width, tau_max = self.width, self.tau_max
+        signal = self._rows(self._windowed, rows)
+        np.subtract(frames, frames.mean(axis=-1, keepdims=True), out=signal)
+
+        # Difference function d(tau) = E(0) + E(tau) - 2 r(tau), with the cross-correlation r computed by FFT
+        # and the energies E taken from a running sum of the squared signal.
+        head = _rfft(signal[:, :width], self.n_yin, self._rows(self._head_spectrum, rows))
+        full = _rfft(signal, self.n_yin, self._rows(self._full_spectrum, rows))
+        np.conjugate(head, out=head)
+        np.multiply(full, head, out=full)
+        correlation = _irfft(full, self.n_yin, self._rows(self._correlation, rows))[:, :tau_max]
+        energy = self._rows(self._energy, rows)
+        np.square(signal, out=signal)
+        np.cumsum(signal, axis=-1, out=energy[:, 1:])
+        difference = self._rows(self._difference, rows)
+        np.subtract(energy[:, width:width + tau_max], energy[:, :tau_max], out=difference)
+        np.add(difference, energy[:, width:width + 1], out=difference)
+        np.subtract(difference, correlation, out=difference)
+        np.subtract(difference, correlation, out=difference)
+
+        # Cumulative mean normalisation, d'(0) = 1.
+        running = self._rows(self._running, rows)
+        normalized = self._rows(self._normalized, rows)
+        np.cumsum(difference[:, 1:], axis=-1, out=running)
+        np.maximum(running, 1e-20, out=running)
+        np.multiply(difference[:, 1:], self.taus, out=normalized[:, 1:])
+        np.divide(normalized[:, 1:], running, out=normalized[:, 1:])
+
+        # First lag below the threshold, followed down to the bottom of its dip.
+        # Frames that never cross the threshold fall back to the global minimum.
+        search = normalized[:, self.tau_min:tau_max]
+        below = self._rows(self._below, rows)
+        np.less(search, threshold, out=below)
+        first = np.argmax(below, axis=-1)
+        lost = ~below[np.arange(rows), first]
+        dip = self._rows(self._dip, rows)
+        np.greater_equal(search[:, 1:], search[:, :-1], out=dip[:, :-1])
+        dip[:, -1] = True
+        np.logical_and(dip, np.greater_equal(self.lag_index, first[:, np.newaxis], out=below), out=dip)
+        tau = np.argmax(dip, axis=-1)
+        if lost.any():
+            tau[lost] = np.argmin(search[lost], axis=-1)
+        tau = parabolic_interpolation(normalized, tau + self.tau_min)
+        return np.where(energy[:, -1] > 0, self.samplerate / tau, 0.0)
+
+
+    # Returns the FFT bins within 'tolerance' cents of every target frequency as a (targets, width)
+    # index matrix; bands narrower than the widest one are padded with -1.
+    def _string_bands(self, targets, tolerance):
+        key = (tuple(targets), tolerance)
+        bands = self._bands.get(key)
+        if bands is None:
+            target_midi = 69 + 12 * np.log2(np.asarray(targets, dtype=np.float64) / 440.0)
+            first = np.searchsorted(self.bin_midi, target_midi - tolerance / 100)
+            last = np.searchsorted(self.bin_midi, target_midi + tolerance / 100, side='right')
+            # Keep at least three bins per band so the peak can be interpolated.
+            last = np.maximum(last, first + 3)
+            offsets = np.arange((last - first).max())
+            bands = first[:, np.newaxis] + offsets
+            bands[bands >= last[:, np.newaxis]] = -1
+            bands = self._bands[key] = np.minimum(bands, len(self.frequencies) - 2)
+        return bands
+
+    # Returns the strings whose band (see _string_bands) holds a harmonic of a lower target, e.g. in standard
+    # tuning the 3rd harmonic of E2 lies 2 cents below B3, and the 4th of E2 and the 3rd of A2 lie at E4.
+    # Returns a list of (string, lower strings, harmonic numbers), lowest string first.
+    def _string_overlaps(self, targets, tolerance):
+        key = (tuple(targets), tolerance)
+        overlaps = self._overlaps.get(key)
+        if overlaps is None:
+            overlaps = self._overlaps[key] = []
+            for string in np.argsort(targets, kind='stable'):
+                lower = [other for other in range(len(targets)) if targets[other] < targets[string]]
+                harmonics = [round(targets[string] / targets[other]) for other in lower]
+                overlapping = [(other, harmonic) for other, harmonic in zip(lower, harmonics) if harmonic >= 2 and
+                               abs(1200 * np.log2(harmonic * targets[other] / targets[string])) <= tolerance]
+                if overlapping:
+                    overlaps.append((string, *(np.array(values) for values in zip(*overlapping))))
+        return overlaps
+
+    # Spectrum of the Hann window shifted by 'delta' FFT bins (any shape), i.e. the bins around a sinusoid that
+    # lies 'delta' bins below them: the Hann window is the sum of three Dirichlet kernels.
+    def _window_kernel(self, delta):
+        size = self.size
+        angle = 2 * np.pi * np.asarray(delta, dtype=np.float64) / self.n_fft
+        step = 2 * np.pi / (size - 1)
+        kernel = np.zeros(angle.shape, dtype=np.complex128)
+        for shift, weight in ((0, 0.5), (-step, -0.25), (step, -0.25)):
+            shifted = angle + shift
+            half = np.sin(shifted / 2)
+            dirichlet = np.divide(np.sin(size * shifted / 2), half, out=np.full(angle.shape, float(size)),
+                                  where=np.abs(half) > 1e-12)
+            kernel += weight * np.exp(-0.5j * (size - 1) * shifted) * dirichlet
+        return kernel
+
+    # Measures one string whose band also holds harmonics of lower strings at the known bins 'partials'
+    # (frames, partials). Peaks less than about a main lobe apart merge into one, so instead of picking a peak,
+    # the complex spectrum around the band is fitted with a sinusoid of the string plus one at every partial:
+    # the string's frequency is searched on a grid of 'fit_steps' per bin, and the amplitudes are solved by
+    # least squares. Returns the frequencies in Hz and the levels in dBFS of the string, one per frame.
+    def _fit_string(self, spectrum, band, partials, fit_steps=20):
+        band = band[band >= 0]
+        key = (band[0], band[-1], fit_steps)
+        if key not in self._fit_kernels:
+            lobe = 2 * self.n_fft // self.size
+            bins = np.arange(max(band[0] - lobe, 0), min(band[-1] + lobe + 1, len(self.frequencies)))
+            grid = np.arange(band[0], band[-1] + 1e-9, 1 / fit_steps)
+            self._fit_kernels[key] = bins, self._window_kernel(bins[:, np.newaxis] - grid)
+        bins, candidates = self._fit_kernels[key]
+        observed = spectrum[:, bins, np.newaxis]
+        # Remove everything the partials can explain, from the data and from every candidate sinusoid of the
+        # string (orthogonal projection with the QR decomposition of the partials' kernels).
+        basis, _ = np.linalg.qr(self._window_kernel(bins[:, np.newaxis] - partials[:, np.newaxis, :]))
+        observed = observed - basis @ (basis.conj().transpose(0, 2, 1) @ observed)
+        candidates = candidates - basis @ (basis.conj().transpose(0, 2, 1) @ candidates)
+        # The best frequency explains most of what is left: maximise |<candidate, data>|^2 / |candidate|^2.
+        projection = (candidates.conj().transpose(0, 2, 1) @ observed)[..., 0]
+        norm = np.sum(np.abs(candidates) ** 2, axis=1)
+        score = np.divide(np.abs(projection) ** 2, norm, out=np.zeros_like(norm), where=norm > 1e-9 * norm.max())
+        best = np.argmax(score, axis=-1)
+        frequencies = (band[0] + parabolic_interpolation(score, best) / fit_steps) * self.samplerate / self.n_fft
+        rows = np.arange(len(best))
+        amplitude = np.abs(projection[rows, best]) / np.maximum(norm[rows, best], 1e-30)
+        levels = 20 * np.log10(amplitude * np.abs(self._window_kernel(0)) * 4 / self.size + 1e-12)
+        return frequencies, levels
+
+    # Finds the peak closest to every target frequency (e.g. the strings of a tuning) in one spectrum,
+    # so all strings of a strummed chord are measured from a single window.
+    # Only bins within 'tolerance' cents of a target are searched for its peak. A string whose band also
+    # holds a harmonic of a lower string (see _string_overlaps) is measured with _fit_string instead; picking
+    # the peak would be off by up to the tolerance there, as the two peaks merge.
+    # Returns two (frames, targets) arrays: the interpolated peak frequencies in Hz and the peak levels
+    # in dBFS (0 dBFS = a full scale sine wave).
+    def string_peaks(self, frames, targets, tolerance=50):
+        magnitude, log_spectrum = self._spectra(frames)
+        bands = self._string_bands(targets, tolerance)
+        band_magnitude = magnitude[:, bands]
+        band_magnitude[:, bands < 0] = -1
+        peaks = bands[np.arange(len(bands)), np.argmax(band_magnitude, axis=-1)]
+
+        frequencies = np.empty(peaks.shape)
+        for string in range(peaks.shape[1]):
+            frequencies[:, string] = parabolic_interpolation(log_spectrum, peaks[:, string])
+        frequencies *= self.samplerate / self.n_fft
+        # The Hann window halves the amplitude, so a full scale sine peaks at size / 4.
+        levels = 20 * np.log10(np.take_along_axis(magnitude, peaks, axis=-1) * 4 / self.size + 1e-12)
+
+        # Lowest string first, so the harmonics are placed after the strings below have been measured.
+        spectrum = self._rows(self._spectrum, len(frames))
+        for string, lower, harmonics in self._string_overlaps(targets, tolerance):
+            partials = frequencies[:, lower] * harmonics * self.n_fft / self.samplerate
+            frequencies[:, string], fitted_levels = self._fit_string(spectrum, bands[string], partials)
+            # A string that coincides with a partial can't be told apart from it and the fit overestimates
+            # its level; it is never louder than the peak of its band.
+            np.minimum(levels[:, string], fitted_levels, out=levels[:, string])
+        return frequencies, levels
+
+
+# Available pitch estimators. Each one is called with a PitchAnalyzer and a 2-D array with one frame
+# per row and returns the estimated frequency of every frame; new estimators only need to be added here.
+pitch_estimators = {'fft': PitchAnalyzer.estimate_fft,
+                    'hps': PitchAnalyzer.estimate_hps,
+                    'yin': PitchAnalyzer.estimate_yin}
+
+# Work buffer groups (see PitchAnalyzer) each estimator uses, for sizing its batches.
+# An estimator missing here is assumed to use all of them.
+estimator_buffers = {'fft': ('frames', 'spectrum'),
+                     'hps': ('frames', 'spectrum', 'hps'),
+                     'yin': ('frames', 'yin')}
+
+# Cached analyzers, one set per thread because every analyzer owns its work buffers.
+_analyzers = threading.local()
+
+
+# Returns the cached PitchAnalyzer for the given window length and samplerate, creating it on first use.
+def get_analyzer(size, samplerate=44100):
+    cache = getattr(_analyzers, 'cache', None)
+    if cache is None:
+        cache = _analyzers.cache = {}
+    analyzer = cache.get((size, samplerate))
+    if analyzer is None:
+        analyzer = cache[(size, samplerate)] = PitchAnalyzer(size, samplerate)
+    return analyzer
+
+
+# Calculates and returns the dominant frequency from an audio recording.
+# The estimator is chosen with 'method' and defaults to the 'pitch_estimator' setting.
+def calculate_dominant_frequency(recording, samplerate=44100, method=None):
+    frames = np.ravel(recording)[np.newaxis, :]
+    return float(get_analyzer(frames.shape[-1], samplerate).estimate(frames, method)[0])
+
+
+# Adaptive analysis of a live signal: noise gate, onset detection and growing window length.
+# -------------------------------------------------------------------
+# - The level (RMS in dBFS) of the newest hop is measured on every reading. While no note is sounding the
+#   pitch is not estimated at all, so silence costs almost no CPU and does not produce bogus readings.
+#   A note is sounding while the level is above the gate, which adapts to the noise floor of the input,
+#   and until the note has decayed by 'gate_release' dB. The noise floor is measured while no note is sounding;
+#   while the gate is open it only creeps up by 'noise_rise' dB/s, so steady background noise closes the gate
+#   after a few seconds, and is then part of the floor.
+# - When a string is plucked (the gate opens, or the level jumps by 'onset_jump' dB), the analysis starts
+#   again with the shortest window of the ladder for a fast first reading, as soon as that window is filled
+#   with audio of the new note.
+# - As the note sustains, the window grows to the longest one of the ladder that still fits within the audio
+#   since the pluck, for finer resolution and steadier readings.
+# Feed it the most recent 'max_size' samples every hop with update(), then call estimate() when it is ready().
+class AdaptiveAnalyzer:
+    def __init__(self, samplerate, hop_size=512, window_sizes=window_ladder, open_level=gate_open_level,
+                 margin=noise_margin, hysteresis=gate_hysteresis, release=gate_release, jump=onset_jump,
+                 rise=noise_rise):
+        self.samplerate = samplerate
+        self.hop_size = hop_size
+        self.window_sizes = sorted(window_sizes)
+        self.max_size = self.window_sizes[-1]
+        self.open_level = open_level
+        self.margin = margin
+        self.hysteresis = hysteresis
+        self.release = release
+        self.jump = jump
+        self.rise = rise
+        self.reset()
+
+    # Forgets the current note and the noise floor, e.g. after the input stream was reopened.
+    def reset(self):
+        self.sounding = False
+        self.onset = False
+        # Level of the newest hop, loudest level of the current note and noise floor, in dBFS
+        self.level = -np.inf
+        self.peak_level = -np.inf
+        self.noise_floor = None
+        # Stream positions (in samples) of the newest reading and of the last pluck
+        self.position = 0
+        self.onset_position = 0
+
+    # Level at which the gate opens.
+    def open_threshold(self):
+        return max(self.open_level, self.noise_floor + self.margin)
+
+    # Updates the gate with a window whose newest sample is at stream position 'position' (samples since the
+    # stream was opened). Returns True while a note is sounding; 'onset' tells whether it was plucked just now.
+    def update(self, window, position):
+        # The stream was reopened and counts from 0 again.
+        if position < self.position:
+            self.reset()
+        hop = window[..., -self.hop_size:]
+        level = 10 * np.log10(float(np.mean(np.square(hop, dtype=np.float64))) + 1e-20)
+        elapsed = (position - self.position) / self.samplerate
+        previous, self.level, self.position = self.level, level, position
+        # Until the noise has been measured, assume it is well below the gate (a note may already be sounding).
+        if self.noise_floor is None:
+            self.noise_floor = min(level, self.open_level - self.margin)
+
+        if self.sounding:
+            self.onset = level - previous >= self.jump
+            self.peak_level = level if self.onset else max(self.peak_level, level)
+            # The level of a note never stays above the slowly rising noise floor, steady noise does.
+            self.noise_floor = min(self.noise_floor + self.rise * elapsed, level)
+            self.sounding = level >= self.open_threshold() - self.hysteresis and \
+                level >= self.peak_level - self.release
+        else:
+            self.onset = self.sounding = level >= self.open_threshold()
+            if self.sounding:
+                self.peak_level = level
+            else:
+                # The noise floor follows quiet passages at once and louder noise slowly.
+                if level < self.noise_floor:
+                    self.noise_floor = level
+                else:
+                    self.noise_floor += 0.05 * (level - self.noise_floor)
+        if self.onset:
+            # The pluck happened within the newest hop.
+            self.onset_position = position - self.hop_size
+        return self.sounding
+
+    # True when a note is sounding and the shortest window holds only audio of that note; the first milliseconds
+    # after a pluck would mix the attack with what came before it.
+    def ready(self):
+        return self.sounding and self.position - self.onset_position >= self.window_sizes[0]
+
+    # Window length for the current reading: the longest one that fits within the audio since the pluck.
+    def window_size(self):
+        since_onset = self.position - self.onset_position
+        i = bisect_left(self.window_sizes, since_onset + 1) - 1
+        return self.window_sizes[max(i, 0)]
+
+    # Estimates the pitch of the newest 'window_size()' samples of every row of 'window' (see update()).
+    def estimate(self, window, method=None):
+        size = self.window_size()
+        return get_analyzer(size, self.samplerate).estimate(window[..., -size:], method)
+
+
+# Note helpers
+# -------------------------------------------------------------------
+# Equal-temperament note table for one calibration of A4 (a4_min - a4_max Hz).
+# The frequency of every MIDI note (0 - 127) is computed once. A frequency is turned into its nearest note
+# with one logarithm and an index into the table; all methods take a single value or a whole array.
+class NoteTable:
+    def __init__(self, a4=a4_reference):
+        if not a4_min <= a4 <= a4_max:
+            raise ValueError(f"A4 must be between {a4_min:g} and {a4_max:g} Hz")
+        self.a4 = float(a4)
+        self.frequencies = self.a4 * 2 ** ((np.arange(128) - 69) / 12)
+
+    # Returns the fractional MIDI note number of every frequency (NaN for 0 Hz, i.e. no pitch).
+    def midi(self, frequencies):
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        midi = np.full(frequencies.shape, np.nan)
+        np.log2(frequencies / self.a4, out=midi, where=frequencies > 0)
+        return 69 + 12 * midi
+
+    # Finds the nearest note for every frequency.
+    # Returns the MIDI note numbers (-1 for no pitch) and the deviation from those notes in cents (NaN for no pitch).
+    def nearest(self, frequencies):
+        midi = self.midi(frequencies)
+        voiced = ~np.isnan(midi)
+        nearest = np.clip(np.rint(np.nan_to_num(midi)), 0, 127).astype(np.intp)
+        return np.where(voiced, nearest, -1), np.where(voiced, 100 * (midi - nearest), np.nan)
+
+    # Finds the nearest note for every frequency.
+    # Returns an array of note names and an array with the deviation from that note in cents;
+    # frequencies of 0 Hz (no pitch) get an empty name and NaN cents.
+    def to_note(self, frequencies):
+        nearest, cents = self.nearest(frequencies)
+        return np.where(nearest >= 0, midi_note_names[nearest], ''), cents
+
+    # Returns the frequency of a note name such as 'E2', 'Eb2' or 'D#2'. Raises ValueError for unknown names.
+    def frequency(self, note_name):
+        return float(self.frequencies[note_to_midi(note_name)])
+
+    # Returns the deviation of a frequency from the named note in cents.
+    def deviation(self, note_name, frequency):
+        return float(cents_between(frequency, self.frequency(note_name)))
+
+
+# Returns the note table for the given A4 calibration; tables are built once and shared (they never change).
+_note_tables = {}
+
+
+def get_note_table(a4=a4_reference):
+    table = _note_tables.get(a4)
+    if table is None:
+        table = _note_tables.setdefault(a4, NoteTable(a4))
+    return table
+
+
+# Returns the MIDI note number of a note name such as 'E2', 'Eb2' or 'D#2' (case-insensitive).
+# Raises ValueError for unknown names.
+def note_to_midi(note_name):
+    midi = note_midi.get(note_name.strip().casefold())
+    if midi is None:
+        raise ValueError(f"unknown note '{note_name}'")
+    return midi
+
+
+# Returns the deviation of 'frequencies' from 'targets' in cents (NaN where either is not a positive frequency).
+def cents_between(frequencies, targets):
+    frequencies, targets = np.broadcast_arrays(np.asarray(frequencies, dtype=np.float64),
+                                               np.asarray(targets, dtype=np.float64))
+    cents = np.full(frequencies.shape, np.nan)
+    np.log2(frequencies / np.where(targets > 0, targets, 1), out=cents, where=(frequencies > 0) & (targets > 0))
+    return 1200 * cents
+
+
+# Builds the notes of a tuning from note names, e.g. tuning_notes('E2', 'A2', ...) == [{'E2': 82.41}, ...],
+# with the frequencies from the note table (rounded to 0.01 Hz, as in 'tunings.csv').
+def tuning_notes(*note_names, a4=a4_reference):
+    table = get_note_table(a4)
+    return [{note_name: round(table.frequency(note_name), 2)} for note_name in note_names]
+
+
+# Finds the nearest equal-tempered note for every frequency (see NoteTable.to_note()).
+def frequency_to_note(frequencies, a4=a4_reference):
+    return get_note_table(a4).to_note(frequencies)
+
+
+# Batch analysis of recordings
+# -------------------------------------------------------------------
+# Reads a PCM WAV file (a path or a binary file object) and returns its samples as a mono float32 array
+# in [-1, 1] and its samplerate.
+def load_wav(path):
+    with wave.open(path if hasattr(path, 'read') else str(path), 'rb') as wav_file:
+        samplerate = wav_file.getframerate()
+        channels = wav_file.getnchannels()
+        sample_width = wav_file.getsampwidth()
+        data = wav_file.readframes(wav_file.getnframes())
+
+    if sample_width == 1:
+        samples = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 3:
+        # 24-bit samples: place the three bytes in the top of a 32-bit integer to keep the sign.
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        samples = padded.view('<i4').ravel().astype(np.float32) / 2 ** 31
+    else:
+        dtype = {2: '<i2', 4: '<i4'}[sample_width]
+        samples = np.frombuffer(data, dtype=dtype).astype(np.float32) / 2 ** (8 * sample_width - 1)
+
+    # Mix multichannel recordings down to mono.
+    samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return samples, samplerate
+
+
+# Splits a 1-D signal into overlapping frames without copying (each row is a view into the signal).
+def frame_signal(signal, frame_size=4096, hop_size=2048):
+    signal = np.asarray(signal)
+    if len(signal) < frame_size:
+        signal = np.pad(signal, (0, frame_size - len(signal)))
+    return np.lib.stride_tricks.sliding_window_view(signal, frame_size)[::hop_size]
+
+
+# Computes the pitch track of a whole recording in vectorized passes.
+# 'source' is the path of a WAV file, a 1-D signal (split into frames of 'frame_size' every 'hop_size'
+# samples, half a frame by default) or a 2-D array that already holds one frame per row, in which case
+# 'hop_size' must be the hop the caller framed it with.
+# Returns a dictionary of arrays with one value per frame:
+# 'time' (sec, start of the frame), 'frequency' (Hz), 'note' (nearest note name) and 'cents'.
+def analyze_batch(source, samplerate=44100, frame_size=4096, hop_size=None, method=None, a4=a4_reference):
+    if isinstance(source, np.ndarray) and source.ndim == 2:
+        if hop_size is None:
+            raise ValueError("hop_size is required when source is already split into frames")
+        frames = source
+    else:
+        if not isinstance(source, np.ndarray):
+            source, samplerate = load_wav(source)
+        if hop_size is None:
+            hop_size = frame_size // 2
+        frames = frame_signal(source, frame_size, hop_size)
+
+    frequencies = get_analyzer(frames.shape[-1], samplerate).estimate(frames, method)
+
+    notes, cents = frequency_to_note(frequencies, a4)
+    return {'time': np.arange(len(frames)) * hop_size / samplerate,
+            'frequency': frequencies,
+            'note': notes,
+            'cents': cents}
+
+
+# Performance metrics
+# -------------------------------------------------------------------
+# Histogram of durations with fixed, roughly logarithmic buckets (upper bounds in milliseconds).
+class Histogram:
+    bounds = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float('inf'))
+
+    def __init__(self):
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    # Records one duration given in seconds.
+    def observe(self, seconds):
+        milliseconds = seconds * 1000
+        self.counts[bisect_left(self.bounds, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+
+    # Returns the upper bound of the bucket holding the given fraction of observations (e.g. 0.95).
+    def percentile(self, fraction):
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count,
+                'sum_ms': round(self.total, 3),
+                'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+                'p50_ms': self.percentile(0.5) if self.count else 0.0,
+                'p95_ms': self.percentile(0.95) if self.count else 0.0,
+                'max_ms': round(self.max, 3),
+                'buckets_ms': {str(bound): count for bound, count in zip(self.bounds, self.counts)}}
+
+
+# Timing histograms, counters and gauges of the capture -> analysis -> display pipeline.
+# All methods are thread-safe: the audio callback, the detection thread and the GUI all report into it.
+# Stages used by the tuner:
+#   capture_wait - time the detection thread waits for the next hop of audio
+#   dsp          - time spent estimating the pitch of one window
+#   queue        - time a result waits in the queue until the GUI picks it up
+#   ui           - time the GUI spends updating the labels
+#   end_to_end   - time from the arrival of the newest sample of a window until its result is shown
+# Counters: input_overflows (blocks the audio device dropped), skipped_hops (hops the reader fell behind),
+# dropped_results (results the GUI never saw), readings (results shown).
+class PipelineMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def set_gauge(self, gauge, value):
+        with self.lock:
+            self.gauges[gauge] = value
+
+    # Returns all metrics as a dictionary that can be serialised to JSON.
+    def snapshot(self):
+        with self.lock:
+            return {'uptime_s': round(time.time() - self.started, 3),
+                    'stages': {stage: histogram.snapshot() for stage, histogram in self.histograms.items()},
+                    'counters': dict(self.counters),
+                    'gauges': dict(self.gauges)}
+
+    # Returns a short human readable summary, one line per stage and one line of counters.
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = [f"{'stage':<13}{'n':>7}{'mean':>9}{'p95':>9}{'max':>9}  (ms)"]
+        for stage, stats in sorted(snapshot['stages'].items()):
+            lines.append(f"{stage:<13}{stats['count']:>7}{stats['mean_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+                         f"{stats['max_ms']:>9.2f}")
+        lines.extend(f"{name}: {value}" for name, value in sorted({**snapshot['counters'],
+                                                                  **snapshot['gauges']}.items()))
+        return '\n'.join(lines)
+
+    # Returns the metrics in the Prometheus text exposition format.
+    def to_prometheus(self, prefix='tuner'):
+        snapshot = self.snapshot()
+        lines = []
+        for stage, stats in sorted(snapshot['stages'].items()):
+            name = f"{prefix}_{stage}_seconds"
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in stats['buckets_ms'].items():
+                cumulative += count
+                le = '+Inf' if bound == 'inf' else repr(float(bound) / 1000)
+                lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum {stats['sum_ms'] / 1000}")
+            lines.append(f"{name}_count {stats['count']}")
+        for counter, value in sorted(snapshot['counters'].items()):
+            lines.append(f"# TYPE {prefix}_{counter}_total counter")
+            lines.append(f"{prefix}_{counter}_total {value}")
+        for gauge, value in sorted(snapshot['gauges'].items()):
+            lines.append(f"# TYPE {prefix}_{gauge} gauge")
+            lines.append(f"{prefix}_{gauge} {value}")
+        return '\n'.join(lines) + '\n'
+
+    # Writes the metrics to a file; '.prom' files get the Prometheus format, anything else JSON.
+    def export(self, file_path):
+        with open(file_path, 'w') as file:
+            if str(file_path).endswith('.prom'):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), file, indent=2)
+
+
+# Audio capture
+# -------------------------------------------------------------------
+# sounddevice (and the PortAudio library behind it) is only loaded once audio is actually captured,
+# so the analysis functions can be used on machines without audio hardware.
+def _sounddevice():
+    import sounddevice
+    return sounddevice
+
+
+# Returns (index, name, input channels) for every device that can record audio.
+def list_input_devices():
+    devices = _sounddevice().query_devices()
+    return [(index, device['name'], device['max_input_channels']) for index, device in enumerate(devices)
+            if device['max_input_channels'] > 0]
+
+
+# Records audio for a specified duration and samplerate from an audio source (default: the default input device).
+# Returns a (frames, 1) float32 array.
+def record_audio(duration=1.0, samplerate=44100, source=None):
+    frames = int(duration * samplerate)
+    recording = np.zeros((frames, 1), dtype=np.float32)
+    written = 0
+    done = threading.Event()
+
+    def callback(indata, count, time_info, status):
+        nonlocal written
+        take = min(count, frames - written)
+        recording[written:written + take] = indata[:take]
+        written += take
+        if written >= frames:
+            done.set()
+
+    source = source or LiveSource()
+    source.start(samplerate, 1, 1024, callback, done.set)
+    try:
+        done.wait()  # Wait until the recording is finished
+    finally:
+        source.stop()
+    return recording
+
+
+# Audio sources
+# -------------------------------------------------------------------
+# An audio source delivers blocks of float32 samples to a callback with the signature of a sounddevice stream
+# callback, callback(indata, frames, time_info, status), where 'indata' is a (frames, channels) array that is only
+# valid during the call. CaptureEngine and record_audio() read from any source with:
+#   samplerate  - Hz of the audio, or None if the source records at the samplerate it is started with
+#   realtime    - False if the source delivers blocks only as fast as they are taken (see CaptureEngine)
+#   start(samplerate, channels, blocksize, callback, finished=None)
+#               - starts delivering blocks; a source of limited length calls 'finished' after the last block
+#   stop()      - stops delivering blocks; the source can be started again afterwards
+
+# Live input from a sounddevice input device (None = the default input device).
+class LiveSource:
+    realtime = True
+
+    def __init__(self, device=None):
+        self.device = device
+        self.samplerate = None
+        self.stream = None
+
+    def start(self, samplerate, channels, blocksize, callback, finished=None):
+        stream = _sounddevice().InputStream(device=self.device, channels=channels, samplerate=samplerate,
+                                            blocksize=blocksize, dtype='float32', callback=callback)
+        stream.start()
+        self.stream = stream
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+
+# Plays a WAV file (16 or 32-bit PCM, or 32-bit float) as if it were recorded live. The samples are
+# memory-mapped, so long recordings are never loaded into memory as a whole.
+# - realtime=True: blocks are delivered at the speed of the recording, like a live input.
+# - realtime=False: blocks are delivered as fast as they are taken; CaptureEngine then hands out every hop
+#   exactly once, so a replay gives the same readings on every run and machine, only faster.
+# - loop=True: the file starts over at its end instead of finishing.
+# The channels of the file are mixed down to mono, or repeated / cut to the number of channels requested.
+class WavSource:
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = str(path)
+        self.realtime = realtime
+        self.loop = loop
+        self.samplerate, self.samples, self.scale = map_wav(self.path)
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self, samplerate, channels, blocksize, callback, finished=None):
+        if samplerate != self.samplerate:
+            raise ValueError(f"{self.path} has a samplerate of {self.samplerate} Hz, not {samplerate} Hz")
+        self.stop()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._play, args=(self.stop_event, channels, blocksize, callback,
+                                                                finished), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    # Playback thread
+    def _play(self, stop_event, channels, blocksize, callback, finished):
+        samples = self.samples
+        block = np.zeros((blocksize, channels), dtype=np.float32)
+        columns = np.arange(channels) % samples.shape[1]
+        started = time.perf_counter()
+        position = 0
+        delivered = 0
+        while not stop_event.is_set():
+            if position >= len(samples):
+                if not self.loop or len(samples) == 0:
+                    if finished is not None:
+                        finished()
+                    return
+                position = 0
+            frames = min(blocksize, len(samples) - position)
+            chunk = samples[position:position + frames]
+            if channels == 1:
+                np.multiply(chunk.mean(axis=1, dtype=np.float32), self.scale, out=block[:frames, 0])
+            else:
+                np.multiply(chunk[:, columns], self.scale, out=block[:frames], casting='unsafe')
+            position += frames
+            delivered += frames
+            if self.realtime:
+                # A block is available once its last sample has "been recorded".
+                delay = started + delivered / self.samplerate - time.perf_counter()
+                if delay > 0 and stop_event.wait(delay):
+                    return
+            callback(block[:frames], frames, None, None)
+
+
+# Records the input of a CaptureEngine to WAV files (32-bit PCM), ring-file style: a new file is started every
+# 'file_seconds' seconds and only the newest 'max_files' files are kept, e.g. recordings/capture-000042.wav.
+# The audio thread only queues a copy of every block; a background thread writes the files.
+# The files can be played back with WavSource.
+class RingFileRecorder:
+    def __init__(self, directory, samplerate, file_seconds=60, max_files=10):
+        self.directory = str(directory)
+        self.samplerate = samplerate
+        self.file_frames = int(file_seconds * samplerate)
+        self.max_files = max_files
+        os.makedirs(self.directory, exist_ok=True)
+        numbers = [int(name[8:-4]) for name in self._files()]
+        self.next_number = max(numbers, default=0) + 1
+        self.blocks = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    # Queues a block of input, a (frames, channels) float32 array (called from the audio thread).
+    def write(self, indata):
+        self.blocks.put(indata.copy())
+
+    # Writes the queued blocks, closes the current file and stops the writer thread.
+    def close(self):
+        if self.thread.is_alive():
+            self.blocks.put(None)
+            self.thread.join()
+
+    # File names of the recordings in the directory, oldest first.
+    def _files(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith('capture-') and name.endswith('.wav') and name[8:-4].isdigit())
+
+    # Writer thread
+    def _run(self):
+        wav_file = None
+        file_frames = 0
+        try:
+            while True:
+                block = self.blocks.get()
+                if block is None:
+                    return
+                # A full file, or input with another number of channels (e.g. 'Hexaphonic' mode was switched
+                # on or off), starts the next file.
+                if wav_file is None or file_frames >= self.file_frames or wav_file.getnchannels() != block.shape[1]:
+                    if wav_file is not None:
+                        wav_file.close()
+                    wav_file = wave.open(os.path.join(self.directory, f"capture-{self.next_number:06d}.wav"), 'wb')
+                    wav_file.setnchannels(block.shape[1])
+                    wav_file.setsampwidth(4)
+                    wav_file.setframerate(self.samplerate)
+                    self.next_number += 1
+                    file_frames = 0
+                    for name in self._files()[:-self.max_files]:
+                        os.remove(os.path.join(self.directory, name))
+                samples = np.clip(block, -1, 1 - 2 ** -31) * 2 ** 31
+                wav_file.writeframes(samples.astype('<i4').tobytes())
+                file_frames += len(block)
+        finally:
+            if wav_file is not None:
+                wav_file.close()
+
+
+# Memory-maps the samples of a WAV file. Returns the samplerate, a (frames, channels) array of the raw samples
+# and the factor that scales them to [-1, 1]. A file whose recording was cut off (no final data size in the
+# header) is read up to its end.
+def map_wav(path):
+    with open(path, 'rb') as file:
+        header = file.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            chunk = file.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"{path} has no audio data")
+            chunk_id, chunk_size = chunk[:4], int.from_bytes(chunk[4:], 'little')
+            if chunk_id == b'fmt ':
+                fmt = file.read(chunk_size + chunk_size % 2)
+            elif chunk_id == b'data':
+                offset = file.tell()
+                break
+            else:
+                file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+        file_size = os.fstat(file.fileno()).st_size
+    if fmt is None:
+        raise ValueError(f"{path} has no format chunk")
+
+    format_tag = int.from_bytes(fmt[0:2], 'little')
+    channels = int.from_bytes(fmt[2:4], 'little')
+    samplerate = int.from_bytes(fmt[4:8], 'little')
+    bits = int.from_bytes(fmt[14:16], 'little')
+    if format_tag == 0xFFFE and len(fmt) >= 26:
+        # WAVE_FORMAT_EXTENSIBLE: the real format is at the start of the sub-format GUID.
+        format_tag = int.from_bytes(fmt[24:26], 'little')
+    formats = {(1, 16): ('<i2', 2 ** -15), (1, 32): ('<i4', 2 ** -31), (3, 32): ('<f4', 1.0)}
+    if (format_tag, bits) not in formats or channels < 1:
+        raise ValueError(f"{path}: only 16 or 32-bit PCM and 32-bit float WAV files can be played")
+    dtype, scale = formats[(format_tag, bits)]
+
+    frame_bytes = channels * bits // 8
+    if chunk_size == 0 or offset + chunk_size > file_size:
+        chunk_size = file_size - offset
+    frames = chunk_size // frame_bytes
+    if frames == 0:
+        return samplerate, np.zeros((0, channels), dtype=dtype), scale
+    return samplerate, np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, channels)), scale
+
+
+# Capture engine
+# -------------------------------------------------------------------
+# Continuous audio capture engine.
+# Reads from an audio source (by default a live sd.InputStream) and copies every incoming block into a
+# preallocated ring buffer, so no audio is lost between readings. Analysis windows are read from the buffer every hop,
+# which means consecutive windows overlap and readings arrive many times per second.
+# Timing and overrun statistics are reported to 'metrics' (a PipelineMetrics) when one is given, and all input is
+# passed on to 'recorder' (e.g. a RingFileRecorder) when one is given.
+class CaptureEngine:
+    def __init__(self, samplerate=44100, channels=1, hop_size=512, buffer_seconds=2.0, metrics=None, recorder=None):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.hop_size = hop_size
+        # Ring buffer with one column per channel; its length is rounded up to a whole number of hops.
+        capacity = int(buffer_seconds * samplerate)
+        self.capacity = -(-capacity // hop_size) * hop_size
+        self.buffer = np.zeros((self.capacity, channels), dtype=np.float32)
+        # Total number of samples written since the stream was opened (never wraps).
+        self.samples_written = 0
+        # Position of the next hop the reader is waiting for.
+        self.next_read = 0
+        # time.perf_counter() when the newest block arrived, and when the newest sample of the last window read did.
+        self.last_block_time = 0.0
+        self.window_time = 0.0
+        self.metrics = metrics
+        self.recorder = recorder
+        # Device index or audio source given to open(), and the audio source delivering the blocks.
+        self.device = None
+        self.source = None
+        # Stream position the reader waits for; a source that is not real-time only delivers blocks up to it.
+        self.read_target = 0
+        # True once a source of limited length (e.g. a WAV file) has delivered all its audio.
+        self.exhausted = False
+        self.condition = threading.Condition()
+        # Serialises open() and close(), which are called from both the GUI and the detection thread.
+        self.stream_lock = threading.Lock()
+
+    # Opens the input stream on the given device, recording 'channels' channels (default: as before).
+    # 'device' is a device index (None = the default input device) or an audio source, e.g. a WavSource.
+    # The stream is only reopened if the device or the number of channels has changed since the last call.
+    def open(self, device, channels=None):
+        with self.stream_lock:
+            channels = channels or self.channels
+            if self.source is not None and self.device == device and self.channels == channels:
+                return
+            self._close_stream()
+            source = device if hasattr(device, 'start') else LiveSource(device)
+            with self.condition:
+                if channels != self.channels:
+                    self.channels = channels
+                    self.buffer = np.zeros((self.capacity, channels), dtype=np.float32)
+                self.buffer.fill(0)
+                self.samples_written = 0
+                self.next_read = 0
+                self.read_target = 0
+                self.exhausted = False
+                self.source = source
+            try:
+                source.start(self.samplerate, self.channels, self.hop_size, partial(self._callback, source),
+                             partial(self._finished, source))
+            except Exception:
+                with self.condition:
+                    self.source = None
+                raise
+            self.device = device
+
+    # Stops and closes the input stream, if one is open.
+    def close(self):
+        with self.stream_lock:
+            self._close_stream()
+
+    def _close_stream(self):
+        # Wake up a reader that might still be waiting for audio, and a source waiting for the reader.
+        with self.condition:
+            source = self.source
+            self.source = None
+            self.device = None
+            self.condition.notify_all()
+        if source is not None:
+            source.stop()
+
+    # Called by the audio source (for live input: by sounddevice from its audio thread) for every block of input.
+    def _callback(self, source, indata, frames, time_info, status):
+        if status and status.input_overflow and self.metrics is not None:
+            self.metrics.increment('input_overflows')
+        with self.condition:
+            if not source.realtime:
+                # Deliver the next block only once the reader has taken everything before it,
+                # so every hop is analysed exactly once, however long the analysis takes.
+                self.condition.wait_for(lambda: self.samples_written < self.read_target or self.source is not source)
+            if self.source is not source:
+                return
+            if self.recorder is not None:
+                self.recorder.write(indata)
+            start = self.samples_written % self.capacity
+            end = start + frames
+            if end <= self.capacity:
+                self.buffer[start:end] = indata
+            else:
+                split = self.capacity - start
+                self.buffer[start:] = indata[:split]
+                self.buffer[:end - self.capacity] = indata[split:]
+            self.samples_written += frames
+            self.last_block_time = time.perf_counter()
+            self.condition.notify_all()
+
+    # Called by an audio source of limited length after its last block.
+    def _finished(self, source):
+        with self.condition:
+            if self.source is source:
+                self.exhausted = True
+                self.condition.notify_all()
+
+    # Waits for the next hop of audio and returns the most recent 'size' samples as a
+    # (channels, size) array. The window is copied into 'out' when it is given.
+    # Returns None if no new audio arrived within 'timeout' seconds, the stream was closed or the source has no
+    # more audio ('exhausted').
+    def read_window(self, size, out=None, timeout=1.0):
+        if out is None:
+            out = np.empty((self.channels, size), dtype=np.float32)
+        waiting_since = time.perf_counter()
+        with self.condition:
+            target = max(self.next_read + self.hop_size, size)
+            self.read_target = target
+            # A source that is not real-time waits for the reader.
+            self.condition.notify_all()
+            if not self.condition.wait_for(lambda: self.samples_written >= target or self.source is None or
+                                           self.exhausted, timeout):
+                return None
+            if self.source is None or self.samples_written < target:
+                return None
+            # If the reader fell behind, skip straight to the newest audio instead of queueing up stale windows.
+            skipped = (self.samples_written - target) // self.hop_size
+            self.next_read = self.samples_written
+            self.window_time = self.last_block_time
+            end = self.samples_written % self.capacity
+            start = end - size
+            if start >= 0:
+                out[:] = self.buffer[start:end].T
+            else:
+                out[:, :-start] = self.buffer[start:].T
+                out[:, -start:] = self.buffer[:end].T
+        if self.metrics is not None:
+            self.metrics.observe('capture_wait', time.perf_counter() - waiting_since)
+            if skipped > 0:
+                self.metrics.increment('skipped_hops', skipped)
+        return out
+
+
+# Capture from several devices and channels at once, e.g. a hexaphonic pickup (one channel per string) or
+# several instruments on separate interfaces.
+# -------------------------------------------------------------------
+# Parses an input specification 'DEVICE' or 'DEVICE:CHANNELS' into a list of (device, channel) pairs.
+# CHANNELS is a comma separated list of channel numbers (counted from 0) and ranges, e.g. '3:0-5' or '3:0,2'.
+# 'default' stands for the default input device; without CHANNELS, channel 0 is used.
+def parse_input_spec(spec):
+    device, _, channels = spec.partition(':')
+    device = None if device in ('', 'default') else int(device)
+    indices = []
+    for part in (channels or '0').split(','):
+        first, _, last = part.partition('-')
+        indices.extend(range(int(first), int(last or first) + 1))
+    return [(device, channel) for channel in indices]
+
+
+# Captures a list of (device, channel) inputs at once, with one CaptureEngine per device.
+# read_windows() returns the newest window of every input as one (inputs, size) array, in the order of 'inputs',
+# so all of them can be analysed together.
+class MultiChannelEngine:
+    def __init__(self, inputs, samplerate=44100, hop_size=512, buffer_seconds=2.0, metrics=None):
+        self.inputs = list(inputs)
+        self.samplerate = samplerate
+        self.hop_size = hop_size
+        # device -> (engine, rows of 'inputs' recorded by it, channels of the device for those rows)
+        self.devices = {}
+        for row, (device, channel) in enumerate(self.inputs):
+            self.devices.setdefault(device, ([], []))
+            self.devices[device][0].append(row)
+            self.devices[device][1].append(channel)
+        self.engines = {device: CaptureEngine(samplerate, channels=max(channels) + 1, hop_size=hop_size,
+                                              buffer_seconds=buffer_seconds, metrics=metrics)
+                        for device, (rows, channels) in self.devices.items()}
+        self._buffers = {}
+        # Stream position (samples since the stream was opened) of every input's newest sample
+        self.positions = np.zeros(len(self.inputs), dtype=np.int64)
+        # time.perf_counter() when the oldest of the newest blocks arrived, for latency metrics
+        self.window_time = 0.0
+
+    # Opens the input streams of all devices.
+    def open(self):
+        for device, engine in self.engines.items():
+            engine.open(device)
+
+    # Closes the input streams of all devices.
+    def close(self):
+        for engine in self.engines.values():
+            engine.close()
+
+    # Waits for the next hop of every device and returns the most recent 'size' samples of every input as an
+    # (inputs, size) array, copied into 'out' when it is given. Returns None if a device delivered no audio
+    # within 'timeout' seconds or its stream was closed.
+    def read_windows(self, size, out=None, timeout=1.0):
+        if out is None:
+            out = np.empty((len(self.inputs), size), dtype=np.float32)
+        window_times = []
+        for device, engine in self.engines.items():
+            rows, channels = self.devices[device]
+            buffer = self._buffers.get((device, size))
+            if buffer is None:
+                buffer = self._buffers[(device, size)] = np.empty((engine.channels, size), dtype=np.float32)
+            if engine.read_window(size, out=buffer, timeout=timeout) is None:
+                return None
+            out[rows] = buffer[channels]
+            self.positions[rows] = engine.next_read
+            window_times.append(engine.window_time)
+        self.window_time = min(window_times)
+        return out
+
+
+# Pitch tracking of several inputs at once: one AdaptiveAnalyzer (noise gate and window length) per input,
+# and one vectorized estimate for all inputs that currently use the same window length.
+class MultiChannelTracker:
+    def __init__(self, inputs, samplerate, hop_size=512, window_sizes=window_ladder, **gate_settings):
+        self.samplerate = samplerate
+        self.analyzers = [AdaptiveAnalyzer(samplerate, hop_size, window_sizes, **gate_settings)
+                          for _ in range(inputs)]
+        self.max_size = self.analyzers[0].max_size
+        self.frequencies = np.zeros(inputs)
+        self.levels = np.full(inputs, -np.inf)
+
+    # Updates every input with its row of 'windows' (the newest 'max_size' samples each) and estimates the pitch
+    # of the inputs with a sounding note. 'positions' holds the stream position of every row (see
+    # AdaptiveAnalyzer.update()). Returns the frequencies (0 Hz where there is no reading) and the levels in
+    # dBFS (-inf where no note is sounding).
+    def process(self, windows, positions, method=None):
+        self.frequencies.fill(0)
+        self.levels.fill(-np.inf)
+        groups = {}
+        for row, analyzer in enumerate(self.analyzers):
+            analyzer.update(windows[row], positions[row])
+            if analyzer.ready():
+                self.levels[row] = analyzer.level
+                groups.setdefault(analyzer.window_size(), []).append(row)
+        for size, rows in groups.items():
+            self.frequencies[rows] = get_analyzer(size, self.samplerate).estimate(windows[rows, -size:], method)
+        return self.frequencies, self.levels
+
+
+# ***************************
+# *   Command line (CLI)    *
+# ***************************
+# -------------------------------------------------------------------
+# Prints the available input devices.
+def command_devices(args):
+    for index, name, channels in list_input_devices():
+        if args.json:
+            print(json.dumps({'index': index, 'name': name, 'channels': channels}))
+        else:
+            print(f"[{index}] {name} ({channels} ch)")
+
+
+# Streams live pitch readings from an input device to stdout until interrupted with Ctrl+C.
+# With --adaptive, readings are only made while a note is sounding, with a window that grows as it sustains
+# (see AdaptiveAnalyzer). With --metrics, the pipeline metrics are written to the given file on exit.
+# With --replay, a WAV file is played instead of the input device (as fast as possible unless --realtime) and the
+# readings are timed by their position in the file, so every replay prints the same readings.
+# With --record-dir, the input is also recorded to WAV files (see RingFileRecorder).
+def command_tune(args):
+    if args.input:
+        return tune_inputs(args)
+    metrics = PipelineMetrics()
+    source = None
+    if args.replay:
+        source = WavSource(args.replay, realtime=args.realtime)
+        args.samplerate = source.samplerate
+    recorder = RingFileRecorder(args.record_dir, args.samplerate, args.record_seconds, args.record_files) \
+        if args.record_dir else None
+    engine = CaptureEngine(samplerate=args.samplerate, hop_size=args.hop, metrics=metrics, recorder=recorder)
+    analyzer = get_analyzer(args.window, args.samplerate)
+    adaptive = AdaptiveAnalyzer(args.samplerate, args.hop) if args.adaptive else None
+    window = np.empty((1, adaptive.max_size if adaptive else args.window), dtype=np.float32)
+    next_output = 0.0
+    try:
+        engine.open(source if source is not None else args.device)
+        while True:
+            if engine.read_window(window.shape[-1], out=window) is None:
+                if engine.exhausted:
+                    break
+                continue
+            if adaptive is not None:
+                adaptive.update(window, engine.next_read)
+                if not adaptive.ready():
+                    metrics.increment('gated_readings')
+                    continue
+            now = engine.next_read / args.samplerate if source is not None else time.time()
+            if now < next_output:
+                continue
+            next_output = now + args.interval
+            started = time.perf_counter()
+            if adaptive is not None:
+                frequency = adaptive.estimate(window, args.method)
+            else:
+                frequency = analyzer.estimate(window, args.method)
+            metrics.observe('dsp', time.perf_counter() - started)
+            notes, cents = frequency_to_note(frequency, args.a4)
+            if args.json:
+                print(json.dumps({'time': round(now, 3), 'frequency': round(float(frequency[0]), 3),
+                                  'note': str(notes[0]), 'cents': round(float(cents[0]), 2)}), flush=True)
+            else:
+                print(f"{notes[0]:>4} {frequency[0]:8.2f} Hz {cents[0]:+7.1f} cents", flush=True)
+            metrics.observe('end_to_end', time.perf_counter() - engine.window_time)
+            metrics.increment('readings')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        if recorder is not None:
+            recorder.close()
+        if args.metrics:
+            metrics.export(args.metrics)
+
+
+# Streams live pitch readings of several inputs (--input, given more than once or with several channels).
+# Every printed line holds the readings of all inputs with a sounding note.
+def tune_inputs(args):
+    metrics = PipelineMetrics()
+    inputs = [pair for spec in args.input for pair in parse_input_spec(spec)]
+    engine = MultiChannelEngine(inputs, samplerate=args.samplerate, hop_size=args.hop, metrics=metrics)
+    tracker = MultiChannelTracker(len(inputs), args.samplerate, args.hop)
+    windows = np.empty((len(inputs), tracker.max_size), dtype=np.float32)
+    labels = [f"{'default' if device is None else device}:{channel}" for device, channel in inputs]
+    next_output = 0.0
+    try:
+        engine.open()
+        while True:
+            if engine.read_windows(tracker.max_size, out=windows) is None:
+                continue
+            started = time.perf_counter()
+            frequencies, levels = tracker.process(windows, engine.positions, args.method)
+            metrics.observe('dsp', time.perf_counter() - started)
+            now = time.time()
+            voiced = np.flatnonzero(frequencies > 0)
+            if len(voiced) == 0 or now < next_output:
+                continue
+            next_output = now + args.interval
+            notes, cents = frequency_to_note(frequencies[voiced], args.a4)
+            if args.json:
+                print(json.dumps({'time': round(now, 3),
+                                  'inputs': [{'input': labels[row], 'frequency': round(float(frequencies[row]), 3),
+                                              'note': str(note), 'cents': round(float(cent), 2),
+                                              'level': round(float(levels[row]), 1)}
+                                             for row, note, cent in zip(voiced, notes, cents)]}), flush=True)
+            else:
+                print(' | '.join(f"[{labels[row]}] {note:>4} {frequencies[row]:8.2f} Hz {cent:+7.1f} cents"
+                                 for row, note, cent in zip(voiced, notes, cents)), flush=True)
+            metrics.observe('end_to_end', time.perf_counter() - engine.window_time)
+            metrics.increment('readings')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+        if args.metrics:
+            metrics.export(args.metrics)
+
+
+# Prints the pitch track of a WAV file.
+def command_analyze(args):
+    track = analyze_batch(args.file, frame_size=args.window, hop_size=args.hop, method=args.method, a4=args.a4)
+    for time_, frequency, note, cents in zip(track['time'], track['frequency'], track['note'], track['cents']):
+        if args.json:
+            print(json.dumps({'time': round(float(time_), 4), 'frequency': round(float(frequency), 3),
+                              'note': str(note), 'cents': None if np.isnan(cents) else round(float(cents), 2)}))
+        else:
+            print(f"{time_:8.3f} s {note:>4} {frequency:8.2f} Hz {cents:+7.1f} cents")
+
+
+# Entry point of 'python -m tuner_core'.
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tuner_core', description='Headless guitar tuner.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    devices_parser = subparsers.add_parser('devices', help='list the available input devices')
+    devices_parser.add_argument('--json', action='store_true', help='print one JSON object per line')
+    devices_parser.set_defaults(handler=command_devices)
+
+    tune_parser = subparsers.add_parser('tune', help='stream live pitch readings from an input device')
+    tune_parser.add_argument('--device', type=int, default=None, help='input device index (default: system default)')
+    tune_parser.add_argument('--input', action='append', metavar='DEVICE[:CHANNELS]',
+                             help="tune several inputs at once, e.g. '--input 3:0-5' for the six channels of a "
+                                  "hexaphonic pickup or '--input 3 --input 5' for two devices (repeatable; "
+                                  "always adaptive; not with --replay or --record-dir)")
+    tune_parser.add_argument('--samplerate', type=int, default=44100)
+    tune_parser.add_argument('--window', type=int, default=4096, help='analysis window in samples')
+    tune_parser.add_argument('--hop', type=int, default=512, help='samples between two analysis windows')
+    tune_parser.add_argument('--interval', type=float, default=0.1, help='seconds between two printed readings')
+    tune_parser.add_argument('--adaptive', action='store_true',
+                             help=f"only read while a note is sounding, with windows of {window_ladder} samples "
+                                  f"(ignores --window)")
+    tune_parser.add_argument('--metrics', help='write pipeline metrics to this file on exit (.prom or .json)')
+    tune_parser.add_argument('--replay', metavar='FILE',
+                             help='play this WAV file instead of the input device (uses its samplerate)')
+    tune_parser.add_argument('--realtime', action='store_true',
+                             help='with --replay, play at the speed of the recording instead of as fast as possible')
+    tune_parser.add_argument('--record-dir', metavar='DIR', help='also record the input to WAV files in DIR')
+    tune_parser.add_argument('--record-seconds', type=float, default=60, help='length of every recorded file')
+    tune_parser.add_argument('--record-files', type=int, default=10, help='number of recorded files kept')
+    tune_parser.set_defaults(handler=command_tune)
+
+    analyze_parser = subparsers.add_parser('analyze', help='print the pitch track of a WAV file')
+    analyze_parser.add_argument('file')
+    analyze_parser.add_argument('--window', type=int, default=4096, help='analysis window in samples')
+    analyze_parser.add_argument('--hop', type=int, default=2048, help='samples between two analysis windows')
+    analyze_parser.set_defaults(handler=command_analyze)
+
+    for subparser in (tune_parser, analyze_parser):
+        subparser.add_argument('--method', choices=sorted(pitch_estimators), default=None,
+                               help=f"pitch estimator (default: {pitch_estimator})")
+        subparser.add_argument('--a4', type=float, default=a4_reference,
+                               help=f"reference pitch of A4 in Hz ({a4_min:g} - {a4_max:g})")
+        subparser.add_argument('--json', action='store_true', help='print one JSON object per line')
+
+    args = parser.parse_args(argv)
+    if not a4_min <= args.a4 <= a4_max:
+        parser.error(f"--a4 must be between {a4_min:g} and {a4_max:g} Hz")
+    if args.handler is command_tune and args.input and (args.replay or args.record_dir):
+        parser.error("--replay and --record-dir can't be combined with --input")
+    args.handler(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
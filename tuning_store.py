@@ -0,0 +1,567 @@
+import csv
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import contextmanager
+from tuner_core import get_note_table, note_tolerance
+
+# fcntl (file locks shared between processes) is not available on Windows; there the store is only
+# safe within one process.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# ***************************
+# *      Tuning store       *
+# ***************************
+# Storage of the server's tunings.
+# -------------------------------------------------------------------
+# The tunings are kept in memory in a dictionary keyed by tuning name, so looking up, adding and deleting
+# a tuning is O(1). Every change is also appended as one JSON line to a journal file next to the CSV file,
+# which costs one small write instead of rewriting the whole CSV file. Once the journal has grown long
+# enough, a background thread compacts it: the CSV file (the snapshot) is rewritten with all tunings and
+# the journal starts over.
+#
+# Files, for snapshot_path 'tunings.csv':
+#   tunings.csv             - snapshot, same format as before (name, note, frequency, note, frequency, ...)
+#   tunings.csv.meta        - JSON with the version of the snapshot
+#   tunings.csv.journal     - changes made after the snapshot, one JSON object per line:
+#                             {"v": 12, "op": "put", "name": "Drop D", "notes": [{"D2": 73.42}, ...]}
+#                             {"v": 13, "op": "delete", "name": "Drop D"}
+#   tunings.csv.compacting  - journal being compacted (only exists while compacting, or after a crash)
+#   tunings.csv.lock        - lock file, held while a process changes the other files
+#
+# Every change increases the store's version by one.
+#
+# Several processes (e.g. gunicorn workers) can share the same files, each with its own TuningStore:
+# - Changes and compactions hold an exclusive lock on the lock file, so only one process writes at a time.
+# - refresh() picks up the changes other processes made: new lines in the journal are replayed, and the files
+#   are loaded again after another process compacted them. It only costs two os.stat() calls when nothing
+#   has changed, so it is called before every read.
+# - A process always refreshes before it writes, so versions are never used twice.
+# Within a process, 'lock' protects the in-memory state. The file lock is always taken first.
+#
+# The most recent changes are kept in memory (see changes_since()), so clients can be sent just the changes
+# since the version they have.
+class TuningStore:
+    def __init__(self, snapshot_path='tunings.csv', initial_tunings=None, compact_after=1000, history_size=1000):
+        self.snapshot_path = snapshot_path
+        self.meta_path = snapshot_path + '.meta'
+        self.journal_path = snapshot_path + '.journal'
+        self.compacting_path = snapshot_path + '.compacting'
+        self.lock_path = snapshot_path + '.lock'
+        # Tunings written to a new snapshot when the CSV file does not exist yet.
+        self.initial_tunings = initial_tunings or []
+        # Number of journal entries after which the journal is compacted into the snapshot.
+        self.compact_after = compact_after
+
+        # Tuning name -> list of {note: frequency} dictionaries, in insertion order.
+        self.tunings = {}
+        self.version = 0
+        self.journal_entries = 0
+        self.compaction_thread = None
+        self.lock = threading.RLock()
+        # Notified whenever the version changes (see wait_for_change()).
+        self.changed = threading.Condition(self.lock)
+        # The latest journal entries, with versions after 'history_start'.
+        self.history = deque()
+        self.history_size = history_size
+        self.history_start = 0
+        # Search indexes, rebuilt on the first query after a change (see index()).
+        self._index = None
+        # What has been read from the files: the identity of the snapshot file, and the inode of the journal
+        # with the number of bytes replayed from it. Used by refresh() to find changes made by other processes.
+        self._snapshot_id = None
+        self._journal_inode = None
+        self._journal_offset = 0
+
+    # Holds the exclusive lock on the lock file (only the in-process lock where fcntl is not available).
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            with self.lock:
+                yield
+            return
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Loading
+    # -------------------------------------------------------------------
+    # Loads the snapshot and replays the journal. Creates the snapshot from 'initial_tunings' if it is missing.
+    def load(self):
+        with self._file_lock(), self.lock:
+            self._load()
+
+    def _load(self):
+        previous_version = self.version
+        self.tunings = {}
+        self.version = 0
+        self.journal_entries = 0
+        self._journal_inode = None
+        self._journal_offset = 0
+        if not os.path.exists(self.snapshot_path):
+            for tuning in self.initial_tunings:
+                for tuning_name, notes in tuning.items():
+                    self.tunings[tuning_name] = notes
+            self._write_snapshot(list(self.tunings.items()), self.version)
+            self._reset_history()
+            return
+
+        self._snapshot_id = file_id(self.snapshot_path)
+        self.tunings = dict(read_tunings_csv(self.snapshot_path))
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as file:
+                self.version = json.load(file)['version']
+        # The history can be kept if the snapshot holds no changes that have not been seen yet; the changes
+        # after the snapshot are replayed from the journal below. Otherwise it starts again at the snapshot.
+        if self.version > previous_version or self.version < self.history_start:
+            self._reset_history()
+        # A journal left over from an interrupted compaction (or one another process is compacting right now)
+        # is replayed first. Replaying changes that are already in the snapshot is harmless, as every entry
+        # overwrites or deletes one tuning.
+        for entry in read_journal(self.compacting_path):
+            self._apply(entry)
+        self._read_journal()
+
+    # Replays the journal lines added since the last read. Only complete lines are read, so a line that
+    # another process is writing right now is read next time.
+    def _read_journal(self):
+        try:
+            file = open(self.journal_path, 'rb')
+        except FileNotFoundError:
+            return
+        with file:
+            inode = os.fstat(file.fileno()).st_ino
+            if inode != self._journal_inode:
+                self._journal_inode = inode
+                self._journal_offset = 0
+            file.seek(self._journal_offset)
+            data = file.read()
+        for line in data[:data.rfind(b'\n') + 1].splitlines(keepends=True):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            self._apply(entry)
+            self.journal_entries += 1
+            self._journal_offset += len(line)
+
+    # Picks up the changes made by other processes since the files were last read.
+    def refresh(self):
+        with self.lock:
+            snapshot_id = file_id(self.snapshot_path)
+            journal_id = file_id(self.journal_path)
+            if snapshot_id != self._snapshot_id or \
+                    (self._journal_inode is not None and (journal_id is None or journal_id[0] != self._journal_inode)):
+                # Another process compacted the files (or the CSV file was replaced): load everything again.
+                self._load()
+            elif journal_id is not None and journal_id[1] != self._journal_offset:
+                self._read_journal()
+
+    # Applies one journal entry to the in-memory tunings.
+    def _apply(self, entry):
+        if entry['op'] == 'put':
+            self.tunings[entry['name']] = entry['notes']
+        elif entry['op'] == 'delete':
+            self.tunings.pop(entry['name'], None)
+        self.version = max(self.version, entry['v'])
+        # Entries replayed again (e.g. after another process compacted the files) are only recorded once.
+        if entry['v'] > (self.history[-1]['v'] if self.history else self.history_start):
+            if len(self.history) >= self.history_size:
+                self.history_start = self.history.popleft()['v']
+            self.history.append(entry)
+            self.changed.notify_all()
+
+    # Starts the history of changes again at the current version.
+    def _reset_history(self):
+        self.history.clear()
+        self.history_start = self.version
+        self.changed.notify_all()
+
+    # Reading
+    # -------------------------------------------------------------------
+    def __len__(self):
+        return len(self.tunings)
+
+    def __contains__(self, tuning_name):
+        return tuning_name in self.tunings
+
+    # Returns the notes of a tuning, or None if there is no tuning with that name.
+    def get(self, tuning_name):
+        return self.tunings.get(tuning_name)
+
+    # Returns the names of all tunings, in insertion order.
+    def names(self):
+        with self.lock:
+            return list(self.tunings)
+
+    # Returns all tunings as a list of single-key dictionaries {tuning name: notes},
+    # the format used by the templates and the API.
+    def as_list(self):
+        with self.lock:
+            return [{tuning_name: notes} for tuning_name, notes in self.tunings.items()]
+
+    # Returns all (tuning name, notes) pairs, in insertion order.
+    def items(self):
+        with self.lock:
+            return list(self.tunings.items())
+
+    # Returns the journal entries after the given version, oldest first, e.g.
+    #   [{"v": 12, "op": "put", "name": "Drop D", "notes": [...]}, {"v": 13, "op": "delete", "name": "Drop D"}]
+    # Returns None if they are no longer all in the history (or the version is unknown); the client then has to
+    # load all tunings again.
+    def changes_since(self, version):
+        with self.lock:
+            if version < self.history_start or version > self.version:
+                return None
+            return [entry for entry in self.history if entry['v'] > version]
+
+    # Waits until the version differs from the given one, or the timeout (seconds) has passed.
+    # Only changes made by this process wake the waiter up; call refresh() to look for changes of other processes.
+    def wait_for_change(self, version, timeout):
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+
+    # Returns the search indexes for the current version of the tunings.
+    def index(self):
+        with self.lock:
+            if self._index is None or self._index.version != self.version:
+                self._index = TuningIndex(self.tunings, self.version)
+            return self._index
+
+    # Writing
+    # -------------------------------------------------------------------
+    # Adds a tuning, or replaces the tuning with the same name.
+    def put(self, tuning_name, notes):
+        self.put_many([(tuning_name, notes)])
+
+    # Adds or replaces many tunings with a single journal write, e.g. for a bulk import.
+    # 'items' is an iterable of (tuning name, notes) pairs. Returns the number of tunings written.
+    def put_many(self, items):
+        with self._file_lock(), self.lock:
+            self.refresh()
+            entries = [{'v': self.version + i, 'op': 'put', 'name': tuning_name, 'notes': notes}
+                       for i, (tuning_name, notes) in enumerate(items, start=1)]
+            self._write(entries)
+            return len(entries)
+
+    # Deletes a tuning. Returns False if there was no tuning with that name.
+    def delete(self, tuning_name):
+        with self._file_lock(), self.lock:
+            self.refresh()
+            if tuning_name not in self.tunings:
+                return False
+            self._write([{'v': self.version + 1, 'op': 'delete', 'name': tuning_name}])
+            return True
+
+    # Appends numbered changes to the journal with a single write and applies them.
+    # Must be called with the file lock held, right after refresh().
+    def _write(self, entries):
+        if not entries:
+            return
+        data = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries).encode('utf-8')
+        with open(self.journal_path, 'ab') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+            inode = os.fstat(file.fileno()).st_ino
+        # The journal is only written under the file lock, so nothing was appended between refresh() and here.
+        if inode != self._journal_inode:
+            self._journal_inode = inode
+            self._journal_offset = 0
+        self._journal_offset += len(data)
+        for entry in entries:
+            self._apply(entry)
+        self.journal_entries += len(entries)
+        if self.journal_entries >= self.compact_after:
+            self.compact_in_background()
+
+    # Compaction
+    # -------------------------------------------------------------------
+    # Starts compacting the journal in a background thread, unless a compaction is already running.
+    def compact_in_background(self):
+        with self.lock:
+            if self.compaction_thread is not None and self.compaction_thread.is_alive():
+                return
+            self.compaction_thread = threading.Thread(target=self.compact, daemon=True)
+            self.compaction_thread.start()
+
+    # Writes all tunings to a new snapshot and clears the journal.
+    # The file lock is held for the whole compaction, so other processes never see a second compaction start
+    # before the first one has finished. Within this process, reads continue while the snapshot is written.
+    def compact(self):
+        with self._file_lock():
+            with self.lock:
+                self.refresh()
+                if os.path.exists(self.journal_path):
+                    os.replace(self.journal_path, self.compacting_path)
+                self.journal_entries = 0
+                self._journal_inode = None
+                self._journal_offset = 0
+                items = list(self.tunings.items())
+                version = self.version
+            self._write_snapshot(items, version)
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+
+    # Writes a snapshot and its version. Each file is written to a temporary file first and then renamed,
+    # so readers never see a half-written file. The version is written first: other processes load the files
+    # again when the snapshot changes, and must then find its version.
+    def _write_snapshot(self, items, version):
+        with open(self.meta_path + '.tmp', 'w') as file:
+            json.dump({'version': version}, file)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'w', newline='') as file:
+            write_tunings_csv(file, items)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        with self.lock:
+            self._snapshot_id = file_id(self.snapshot_path)
+
+
+# Search indexes over one version of the tunings.
+# -------------------------------------------------------------------
+# Built once per version, then every query is answered with binary searches and set lookups:
+#   - names sorted case-insensitively, for name prefix searches
+#   - the names of the tunings that use each note
+#   - the tunings sorted by the frequency of their lowest string, for frequency ranges
+class TuningIndex:
+    def __init__(self, tunings, version):
+        self.version = version
+        # Names in store order, and the position of every name, used to return results in that order.
+        self.names = list(tunings)
+        self.positions = {tuning_name: i for i, tuning_name in enumerate(self.names)}
+
+        self.sorted_names = sorted((tuning_name.casefold(), tuning_name) for tuning_name in self.names)
+        self.sorted_keys = [key for key, tuning_name in self.sorted_names]
+
+        self.note_names = {}
+        lowest = []
+        for tuning_name, notes in tunings.items():
+            frequencies = []
+            for note in notes:
+                for note_name, frequency in note.items():
+                    self.note_names.setdefault(note_name.casefold(), set()).add(tuning_name)
+                    frequencies.append(frequency)
+            if frequencies:
+                lowest.append((min(frequencies), tuning_name))
+        lowest.sort()
+        self.lowest_frequencies = [frequency for frequency, tuning_name in lowest]
+        self.lowest_names = [tuning_name for frequency, tuning_name in lowest]
+
+    # Returns the names of the tunings matching all given filters, in store order:
+    # - prefix: the tuning name starts with this text (case-insensitive)
+    # - note: the tuning uses this note on any string (e.g. 'D2', case-insensitive)
+    # - lowest_min / lowest_max: the lowest string is tuned to at least / at most this frequency in Hz
+    def query(self, prefix=None, note=None, lowest_min=None, lowest_max=None):
+        candidates = []
+        if prefix:
+            key = prefix.casefold()
+            start = bisect_left(self.sorted_keys, key)
+            # '\U0010ffff' sorts after every character, so this finds the end of the names with the prefix.
+            end = bisect_right(self.sorted_keys, key + '\U0010ffff')
+            candidates.append({tuning_name for key, tuning_name in self.sorted_names[start:end]})
+        if note:
+            candidates.append(self.note_names.get(note.casefold(), set()))
+        if lowest_min is not None or lowest_max is not None:
+            start = 0 if lowest_min is None else bisect_left(self.lowest_frequencies, lowest_min)
+            end = len(self.lowest_frequencies) if lowest_max is None else \
+                bisect_right(self.lowest_frequencies, lowest_max)
+            candidates.append(set(self.lowest_names[start:end]))
+
+        if not candidates:
+            return self.names
+        matches = set.intersection(*sorted(candidates, key=len))
+        return sorted(matches, key=self.positions.__getitem__)
+
+
+# ***************************
+# *        Functions        *
+# ***************************
+# File formats
+# -------------------------------------------------------------------
+# Reads a tunings CSV file and yields (tuning name, notes) pairs.
+# Each row holds the tuning name followed by note and frequency pairs.
+def read_tunings_csv(file_path):
+    with open(file_path, 'r', newline='') as file:
+        for row in csv.reader(file):
+            if row:
+                yield row[0], [{row[i]: float(row[i + 1])} for i in range(1, len(row), 2)]
+
+
+# Writes (tuning name, notes) pairs to an open file in the tunings CSV format.
+def write_tunings_csv(file, items):
+    writer = csv.writer(file)
+    for tuning_name, notes in items:
+        row = [tuning_name]
+        for note in notes:
+            for note_name, frequency in note.items():
+                row.extend([note_name, frequency])
+        writer.writerow(row)
+
+
+# Bulk import parsing
+# -------------------------------------------------------------------
+# The parsers read the input as a stream and yield one (line number, tuning name, notes, error) tuple per tuning,
+# so a large import never has to be held in memory as text. 'error' is None for a valid tuning; for an invalid
+# one it describes the problem and the notes are None.
+# CSV:    Standard,E2,82.41,A2,110.0,D3,146.83,G3,196.0,B3,246.94,E4,329.63
+# NDJSON: {"Standard": [{"E2": 82.41}, {"A2": 110.0}, ...]}  (one tuning per line)
+# JSON:   [{"Standard": [{"E2": 82.41}, ...]}, {"Drop D": [...]}]  (the format of '/api/tunings')
+
+# Number of strings of every tuning (the layout of 'tunings.csv').
+string_count = 6
+
+# Longest JSON array element accepted by parse_tunings_json(), in characters.
+max_json_element_size = 65536
+
+# Names a tuning can't have: the server's routes '/api/tunings/<name>' that shadow the lookup of a tuning.
+reserved_tuning_names = {'bulk', 'export', 'events'}
+
+
+# Checks the notes of a tuning and returns them as a list of {note: frequency} dictionaries.
+# Raises ValueError if the tuning does not have six strings with a note name and a positive frequency each,
+# or if a frequency is more than 'note_tolerance' cents away from its note (e.g. {"E2": 110.0}),
+# and for the names in 'reserved_tuning_names'.
+def validate_tuning(tuning_name, notes):
+    if not isinstance(tuning_name, str) or not tuning_name.strip():
+        raise ValueError("missing tuning name")
+    if tuning_name in reserved_tuning_names:
+        raise ValueError(f"'{tuning_name}' is reserved for the API, choose another name")
+    if not isinstance(notes, list) or len(notes) != string_count:
+        raise ValueError(f"expected {string_count} notes")
+    validated = []
+    for note in notes:
+        if not isinstance(note, dict) or len(note) != 1:
+            raise ValueError("every note must be a single {note: frequency} pair")
+        (note_name, frequency), = note.items()
+        if not isinstance(note_name, str) or not note_name.strip():
+            raise ValueError("missing note name")
+        if isinstance(frequency, bool) or not isinstance(frequency, (int, float, str)):
+            raise ValueError(f"invalid frequency for {note_name}")
+        frequency = float(frequency)
+        if not 0 < frequency < float('inf'):
+            raise ValueError(f"invalid frequency for {note_name}")
+        # Note names are looked up in the note table (A4 = 440 Hz); this also rejects unknown names.
+        if abs(get_note_table().deviation(note_name, frequency)) > note_tolerance:
+            raise ValueError(f"{frequency:g} Hz is not a {note_name.strip()}")
+        validated.append({note_name: frequency})
+    return validated
+
+
+# Parses CSV rows in the 'tunings.csv' layout from a text stream.
+def parse_tunings_csv(text_stream):
+    reader = csv.reader(text_stream)
+    for row in reader:
+        if not row:
+            continue
+        line = reader.line_num
+        if len(row) != 1 + 2 * string_count:
+            yield line, row[0], None, f"expected a name and {string_count} note/frequency pairs"
+            continue
+        try:
+            notes = validate_tuning(row[0], [{row[i]: row[i + 1]} for i in range(1, len(row), 2)])
+            yield line, row[0], notes, None
+        except ValueError as error:
+            yield line, row[0], None, str(error)
+
+
+# Parses JSON objects {tuning name: notes}, one per line, from a text stream.
+def parse_tunings_ndjson(text_stream):
+    for line, text in enumerate(text_stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            tuning = json.loads(text)
+        except json.JSONDecodeError as error:
+            yield line, None, None, f"invalid JSON: {error.msg}"
+            continue
+        yield from parse_tuning_object(line, tuning)
+
+
+# Parses a JSON array of {tuning name: notes} objects from a text stream, decoding one array element at a time.
+# The position of every tuning is given as its index in the array.
+def parse_tunings_json(text_stream, chunk_size=65536):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    index = 0
+    at_end = False
+    started = False
+    while True:
+        # Skip whitespace and separators between the array elements.
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != '[':
+                    yield 1, None, None, "expected a JSON array"
+                    return
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                tuning, position = decoder.raw_decode(buffer, position)
+                index += 1
+                yield from parse_tuning_object(index, tuning)
+                continue
+            except json.JSONDecodeError as error:
+                # The element is incomplete and continues in the next chunk, unless the input has ended
+                # or the element is too long to be a tuning.
+                if at_end or len(buffer) - position > max_json_element_size:
+                    yield index + 1, None, None, f"invalid JSON: {error.msg}"
+                    return
+        elif at_end:
+            if started:
+                yield index + 1, None, None, "unterminated JSON array"
+            return
+        chunk = text_stream.read(chunk_size)
+        at_end = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+# Validates a decoded {tuning name: notes} object.
+def parse_tuning_object(line, tuning):
+    if not isinstance(tuning, dict) or len(tuning) != 1:
+        yield line, None, None, "expected an object with a single tuning"
+        return
+    (tuning_name, notes), = tuning.items()
+    try:
+        yield line, tuning_name, validate_tuning(tuning_name, notes), None
+    except ValueError as error:
+        yield line, tuning_name, None, str(error)
+
+
+# Returns (inode, size, modification time) of a file, or None if it does not exist.
+def file_id(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+# Yields the entries of a journal file; a missing file has no entries.
+# A torn last line (e.g. after a power loss during a write) is ignored.
+def read_journal(file_path):
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, 'r') as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                break